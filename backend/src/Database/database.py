@@ -6,6 +6,7 @@ from .models import (
     ImageAnnotation,
     Annotation,
     Image,
+    ImageMetadata,
     User,
     LoginSession,
     VerificationCode,
@@ -13,10 +14,13 @@ from .models import (
     VideoFrame,
 )
 from ..logger import logger
+from ..config import defaultEmbeddingConfig
 import torch
 import io
 import PIL.Image
 from ..utils.utils import exportProjectToCOCO, hashString
+from ..utils.tensorBytes import tensor_from_bytes, tensor_to_bytes
+from ..utils.base64Bytes import base64_bytes_validator
 from pymongo import MongoClient
 import json
 import os
@@ -31,7 +35,9 @@ class Database:
         mongo_url: str = "",
         mongo_host: str = "localhost",
         mongo_port: int = 27017,
+        embedding_dtype: str = defaultEmbeddingConfig.dtype,
     ):
+        self.embedding_dtype = embedding_dtype
         if not redis_url:
             redis_url = f"redis://@{redis_host}:{redis_port}"
         self.cache = redis.from_url(redis_url)
@@ -202,7 +208,7 @@ class Database:
     def delete_image(self, projectId: str, imageId: str) -> None:
         project = self.get_project(projectId)
         project.removeImageAnnotation(imageId)
-        self.delete_db("images", imageId, query={"image_id": imageId})
+        self.delete_image_entries(imageId)
         self.store_project(project)
 
     def delete_annotation(
@@ -233,32 +239,122 @@ class Database:
         project.setDefaultClass(className)
         self.store_project(project)
 
+    @staticmethod
+    def embedding_key(imageId: str) -> str:
+        return f"{imageId}:embedding"
+
     def set_image_embeddings(self, imageId: str, embeddings: torch.Tensor) -> None:
-        image = self.get_image(imageId)
-        image.image_embeddings = embeddings
-        self.store_image(image)
+        data = tensor_to_bytes(embeddings, dtype=self.embedding_dtype)
+        self.write_to_cache(self.embedding_key(imageId), data)
+
+    def has_image_embeddings(self, imageId: str) -> bool:
+        if self.cache.exists(self.embedding_key(imageId)):
+            return True
+        query = {"image_id": imageId}
+        return self.mongo["embeddings"].count_documents(query, limit=1) > 0
+
+    def get_image_embeddings(self, imageId: str) -> torch.Tensor:
+        key = self.embedding_key(imageId)
+        data = self.read_from_cache(key)
+        if data is None:
+            embedding = self.read_from_mongo("embeddings", {"image_id": imageId})
+            if embedding is None:
+                return None
+            data = embedding["data"]
+            self.write_to_cache(key, data)
+        return tensor_from_bytes(data)
+
+    def store_image_embeddings(self, imageId: str) -> None:
+        data = self.read_from_cache(self.embedding_key(imageId))
+        if data is not None:
+            self.write_to_mongo(
+                "embeddings",
+                {"image_id": imageId, "data": data},
+                query={"image_id": imageId},
+            )
+
+    def delete_image_embeddings(self, imageId: str) -> None:
+        self.delete_db(
+            "embeddings", self.embedding_key(imageId), query={"image_id": imageId}
+        )
+
+    @staticmethod
+    def image_bytes_key(imageId: str) -> str:
+        return f"{imageId}:bytes"
 
     def store_image(self, image: Image, cache_only: bool = True) -> None:
+        # Metadata, encoded bytes and embedding are separate entries so each
+        # caller only moves what it needs
+        metadata = image.metadata
         if not cache_only:
-            self.write_db(
+            self.write_to_mongo(
                 "images",
-                image.dict(),
-                image.image_id,
+                {**metadata.dict(), "image_bytes": image.image_bytes},
                 query={"image_id": image.image_id},
             )
+        self.write_to_cache(image.image_id, metadata.json())
+        self.write_to_cache(self.image_bytes_key(image.image_id), image.image_bytes)
+
+    def migrate_legacy_image(self, imageId: str, cache_only: bool = True) -> Image:
+        # Images stored before the split layout are a single Image document,
+        # under the bare id in the cache or without metadata fields in mongo.
+        # They are rewritten as separate entries on first access.
+        data = self.read_from_cache(imageId)
+        if data is not None:
+            image = Image.parse_raw(data)
         else:
-            self.write_to_cache(image.image_id, image.json())
+            data = self.read_from_mongo("images", {"image_id": imageId})
+            if data is None:
+                raise KeyError(f"Image {imageId} not found")
+            image = Image.parse_obj(data)
+        logger.info(f"Migrating image {imageId} to the split layout")
+        self.store_image(image, cache_only=cache_only)
+        return image
+
+    def get_image_metadata(self, imageId: str) -> ImageMetadata:
+        data = self.read_from_cache(imageId)
+        if data is not None:
+            if "image_bytes" in json.loads(data):
+                return self.migrate_legacy_image(imageId).metadata
+            return ImageMetadata.parse_raw(data)
+
+        data = self.mongo["images"].find_one(
+            {"image_id": imageId}, {"_id": 0, "image_bytes": 0}
+        )
+        if data is None:
+            raise KeyError(f"Image {imageId} not found")
+        if "num_bytes" not in data:
+            return self.migrate_legacy_image(imageId, cache_only=False).metadata
+        metadata = ImageMetadata.parse_obj(data)
+        self.write_to_cache(imageId, metadata.json())
+        return metadata
+
+    def get_image_bytes(self, imageId: str) -> bytes:
+        key = self.image_bytes_key(imageId)
+        data = self.read_from_cache(key)
+        if data is not None:
+            return data
+
+        legacy = self.read_from_cache(imageId)
+        if legacy is not None and "image_bytes" in json.loads(legacy):
+            return self.migrate_legacy_image(imageId).image_bytes
+
+        data = self.mongo["images"].find_one(
+            {"image_id": imageId}, {"_id": 0, "image_bytes": 1}
+        )
+        if data is None:
+            raise KeyError(f"Image {imageId} not found")
+        image_bytes = base64_bytes_validator(data["image_bytes"])
+        self.write_to_cache(key, image_bytes)
+        return image_bytes
 
     def get_image(self, imageID: str) -> Image:
-        image_data = self.read_db("images", imageID, query={"image_id": imageID})
-        if image_data is None:
-            raise KeyError(f"Image {imageID} not found")
-
-        if isinstance(image_data, (str, bytes)):
-            image = Image.parse_raw(image_data)
-        elif isinstance(image_data, dict):
-            image = Image.parse_obj(image_data)
-        return image
+        return Image(image_id=imageID, image_bytes=self.get_image_bytes(imageID))
+
+    def delete_image_entries(self, imageId: str) -> None:
+        self.delete_db("images", imageId, query={"image_id": imageId})
+        self.delete_from_cache(self.image_bytes_key(imageId))
+        self.delete_image_embeddings(imageId)
 
     def store_user(self, user: User, cache_only: bool = False) -> None:
         if not cache_only:
@@ -383,6 +479,7 @@ class Database:
         for imageAnn in project.imageAnnotations:
             image = self.get_image(imageAnn.image_id)
             self.store_image(image, cache_only=False)
+            self.store_image_embeddings(imageAnn.image_id)
 
     def add_activation_code(self, user_email) -> None:
         user = self.get_user_from_mongo(user_email)
@@ -472,7 +569,7 @@ class Database:
             logger.warning(f"Video {video_id} not found")
             return
         for frame in video.videoFrames:
-            self.delete_db("images", frame.image_id, query={"image_id": frame.image_id})
+            self.delete_image_entries(frame.image_id)
 
         project.removeVideoAnnotation(video_id)
         self.store_project(project)
@@ -507,11 +604,12 @@ class Database:
 
         image_paths = []
         for imageAnnotation in project.imageAnnotations:
-            image = self.get_image(imageAnnotation.image_id)
+            image_bytes = self.get_image_bytes(imageAnnotation.image_id)
             image_path = os.path.join(temp_dir, imageAnnotation.file_name)
             image_paths.append(image_path)
-            with PIL.Image.open(io.BytesIO(image.image_bytes)) as img:
-                img.save(image_path)
+            # The stored bytes are the uploaded file, no need to decode them
+            with open(image_path, "wb") as f:
+                f.write(image_bytes)
 
         json_path = os.path.join(temp_dir, '_annotations.coco.json')
         with open(json_path, 'w') as f:
@@ -1,6 +1,6 @@
 from .annotation import Annotation
 from .imageAnnotation import ImageAnnotation
 from .project import Project
-from .image import Image
+from .image import Image, ImageMetadata
 from .user import User, LoginSession, VerificationCode
 from .videoAnnotation import VideoAnnotation, VideoFrame
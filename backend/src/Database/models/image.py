@@ -1,18 +1,36 @@
 from pydantic import BaseModel
-from ...utils.serialisableTensor import TorchTensor
 from ...utils.base64Bytes import base64Bytes
+from ...utils.imageDecoder import DecodedImage, load_image
 import io
-import numpy as np
 import PIL.Image
 
 
+class ImageMetadata(BaseModel):
+    image_id: str
+    width: int = 0
+    height: int = 0
+    num_bytes: int = 0
+
+
 class Image(BaseModel):
     image_id: str
     image_bytes: base64Bytes
-    image_embeddings: TorchTensor = None
+
+    @property
+    def metadata(self) -> ImageMetadata:
+        # Only the header is parsed to read the size
+        width, height = PIL.Image.open(io.BytesIO(self.image_bytes)).size
+        return ImageMetadata(
+            image_id=self.image_id,
+            width=width,
+            height=height,
+            num_bytes=len(self.image_bytes),
+        )
 
     @property
     def image_ndarray(self):
-        return np.array(PIL.Image.open(io.BytesIO(self.image_bytes)), dtype=np.uint8)[
-            :, :, :3
-        ]
+        return load_image(self.image_id, self.image_bytes)[0]
+
+    def reduced_ndarray(self, min_size: int) -> DecodedImage:
+        # Pixels with a long side of at least min_size, and the full image size
+        return load_image(self.image_id, self.image_bytes, min_size)
@@ -69,6 +69,17 @@ class Project(BaseModel):
         )
         return None
 
+    def getFollowingImageIDs(self, imageId: str, count: int) -> List[str]:
+        sequences = [self.imageAnnotations] + [
+            video.videoFrames for video in self.videoAnnotations
+        ]
+        for images in sequences:
+            ids = [image.image_id for image in images]
+            if imageId in ids:
+                start = ids.index(imageId) + 1
+                return ids[start : start + count]
+        return []
+
     def getProjectSummary(self) -> dict:
         return {
             "project_id": self.project_id,
@@ -2,6 +2,8 @@ from .Database import Database
 from flask import Flask
 from flask_cors import CORS
 from .predictor import PredictorWrapper
+from .precompute import EmbeddingPrecomputer
+from .config import defaultPrecomputeConfig
 from .email_service import MailService
 from flask_socketio import SocketIO
 
@@ -13,6 +15,14 @@ def create_app():
     CORS(app, supports_credentials=True)
     app.database = Database()
     app.predictor = PredictorWrapper()
+    app.precomputer = EmbeddingPrecomputer(
+        app.database,
+        app.predictor,
+        order=defaultPrecomputeConfig.order,
+        lookahead=defaultPrecomputeConfig.lookahead,
+        batch_size=defaultPrecomputeConfig.batch_size,
+        enabled=defaultPrecomputeConfig.enabled,
+    )
     # Mail settings
     app.config["MAIL_SERVER"] = "smtp.gmail.com"
     app.config["MAIL_PORT"] = 465
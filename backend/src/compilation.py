@@ -0,0 +1,30 @@
+from segment_anything.modeling import Sam
+from typing import Callable, Optional
+from .logger import logger
+import time
+import torch
+
+compile_modes = ["compile", "trace"]
+
+
+def compile_sam(
+    sam: Sam, compile_mode: str
+) -> Optional[Callable[[torch.Tensor], torch.Tensor]]:
+    # Returns an image encoder to use in place of the model's, if any
+    assert compile_mode in compile_modes, f"Unknown compile mode {compile_mode}."
+    start = time.perf_counter()
+    image_encoder = None
+    if compile_mode == "compile":
+        # Compilation itself happens lazily, on the warm-up passes
+        sam.image_encoder.compile()
+        # The number of prompt tokens changes with every click
+        sam.mask_decoder.compile(dynamic=True)
+    else:
+        # Tracing bakes in control flow, which only the encoder is free of
+        img_size = sam.image_encoder.img_size
+        dummy_input = torch.zeros(1, 3, img_size, img_size, device=sam.device)
+        with torch.no_grad():
+            traced = torch.jit.trace(sam.image_encoder.eval(), dummy_input)
+        image_encoder = torch.jit.freeze(traced)
+    logger.info(f"Compiled SAM ({compile_mode}) in {time.perf_counter() - start:.3f}s")
+    return image_encoder
@@ -12,3 +12,70 @@ class defaultRedisConfig:
     redis_host: str = "localhost"
     redis_port: int = 6379
     redis_db: int = 0
+
+
+class defaultPredictorConfig:
+    model_type: str = "vit_b"
+    sam_checkpoint: str = "segment-anything/sam_vit_b_01ec64.pth"
+    device: str = None
+    # Decoder requests arriving within this window are run as one batch
+    decoder_batch_wait_ms: float = 5.0
+    decoder_max_batch_size: int = 32
+    # "torch" or "onnx"; the onnx decoder is exported from the loaded checkpoint
+    # at startup unless a model from scripts/export_onnx_model.py is given
+    decoder_backend: str = "torch"
+    decoder_onnx_model: str = None
+    # Image encoding runs in a background pool, optionally pinned to these cores
+    encoder_workers: int = 1
+    encoder_cpu_affinity: List[int] = None
+    # "torch" or "onnx", running a model from scripts/export_onnx_encoder.py
+    encoder_backend: str = "torch"
+    encoder_onnx_model: str = None
+    # Recently used embeddings are kept in memory up to this many bytes
+    embedding_cache_bytes: int = 512 * 1024 * 1024
+    # "float32", "bfloat16" or "float16" autocast of the encoder and decoder,
+    # check the mask IoU with src.embedding_check and src.decoder_check
+    encoder_precision: str = "float32"
+    decoder_precision: str = "float32"
+    # Cache rel-pos tables, the dense PE and other weight-only tensors at load
+    frozen_inference: bool = True
+    # "compile" (torch.compile) or "trace" (TorchScript, encoder only); warm-up
+    # runs dummy encode and decode passes before the first request
+    compile_mode: str = None
+    warmup: bool = False
+    # Images whose longest side is at least tiled_min_side are split into
+    # overlapping tiles, each encoded at native resolution once a prompt
+    # reaches it, instead of being downscaled to the encoder input size.
+    # Objects larger than a tile are clipped or merged across tile seams, so
+    # this is meant for orthomosaic-scale images (e.g. 20000 px) and is off
+    # (None) by default. Tile embeddings are shared by sessions on the same
+    # image and kept for the tiled_cached_images most recently opened images.
+    tiled_min_side: int = None
+    tile_size: int = 1024
+    tile_overlap: int = 256
+    max_cached_tiles: int = 16
+    tiled_cached_images: int = 4
+
+
+class defaultPrecomputeConfig:
+    enabled: bool = True
+    # "upload" encodes in upload order, "current" first encodes the images
+    # following the one an annotator just opened
+    order: str = "upload"
+    lookahead: int = 5
+    # Queued images are taken and run through the image encoder this many at once
+    batch_size: int = 4
+
+
+class defaultEmbeddingConfig:
+    # Embeddings are stored as raw little-endian buffers of this dtype, one of
+    # "float32", "float16" or "int8" (per-channel scale and zero point, check
+    # the mask IoU with `python -m src.embedding_check` before enabling)
+    dtype: str = "float16"
+
+
+class defaultImageConfig:
+    # Decoded images are kept in memory up to this many bytes
+    decoded_cache_bytes: int = 256 * 1024 * 1024
+    # Decode JPEGs at a reduced scale when only the encoder input size is needed
+    reduced_decoding: bool = True
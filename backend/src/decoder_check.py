@@ -0,0 +1,110 @@
+from segment_anything import sam_model_registry, SamPredictor
+from segment_anything.modeling import Sam
+from typing import List
+from PIL import Image as PILImage
+from .config import defaultPredictorConfig
+from .decoders import build_decoder, decoder_backends, TorchMaskDecoder
+from .embedding_check import mask_iou, sample_points
+from .encoders import precisions
+from .scheduler import DecodeRequest
+import argparse
+import numpy as np
+import sys
+import time
+
+
+def run_decoder(decoder, request: DecodeRequest):
+    start = time.perf_counter()
+    decoder.decode([request])
+    masks, scores, logits = request.future.result()
+    return masks.numpy(), scores.numpy(), logits.numpy(), time.perf_counter() - start
+
+
+def check_decoder_parity(
+    sam: Sam,
+    images: List[np.ndarray],
+    candidate,
+    num_prompts: int = 16,
+    seed: int = 0,
+) -> dict:
+    predictor = SamPredictor(sam)
+    decoders = {"reference": TorchMaskDecoder(sam), "candidate": candidate}
+    rng = np.random.default_rng(seed)
+    ious, logit_diffs, score_diffs = [], [], []
+    timings = {name: [] for name in decoders}
+    for image in images:
+        predictor.set_image(image)
+        mask_input = None
+        for i in range(num_prompts):
+            # Cover points only, points with a box and follow-up clicks
+            num_points = rng.integers(1, 4)
+            points = sample_points(predictor.original_size, num_points, rng)[:, 0]
+            labels = rng.integers(0, 2, num_points)
+            box = None
+            if i % 2 == 1:
+                corners = sample_points(predictor.original_size, 2, rng)[:, 0]
+                box = np.concatenate([corners.min(axis=0), corners.max(axis=0)])
+            prompts = predictor.prepare_prompts(points, labels, box, mask_input)
+
+            outputs = {}
+            for name, decoder in decoders.items():
+                request = DecodeRequest(
+                    predictor.features,
+                    predictor.input_size,
+                    predictor.original_size,
+                    *prompts,
+                    multimask_output=i % 4 == 3,
+                )
+                *outputs[name], elapsed = run_decoder(decoder, request)
+                timings[name].append(elapsed)
+
+            masks, scores, logits = outputs["reference"]
+            candidate_masks, candidate_scores, candidate_logits = outputs["candidate"]
+            ious += [mask_iou(a, b) for a, b in zip(masks[0], candidate_masks[0])]
+            logit_diffs.append(float(np.abs(logits - candidate_logits).max()))
+            score_diffs.append(float(np.abs(scores - candidate_scores).max()))
+            mask_input = None if i % 4 == 3 else logits[0, :1]
+    return {
+        "num_masks": len(ious),
+        "mean_iou": float(np.mean(ious)),
+        "min_iou": float(np.min(ious)),
+        "max_logit_diff": max(logit_diffs),
+        "max_score_diff": max(score_diffs),
+        **{f"{name}_ms": 1000 * float(np.mean(t)) for name, t in timings.items()},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Compare a mask decoder against the float32 torch decoder."
+    )
+    parser.add_argument("images", nargs="+", help="Sample images to encode.")
+    parser.add_argument("--model-type", default=defaultPredictorConfig.model_type)
+    parser.add_argument("--checkpoint", default=defaultPredictorConfig.sam_checkpoint)
+    parser.add_argument("--backend", default="onnx", choices=decoder_backends)
+    parser.add_argument("--precision", default="float32", choices=list(precisions))
+    parser.add_argument(
+        "--onnx-model",
+        default=defaultPredictorConfig.decoder_onnx_model,
+        help="Exported decoder, exported from the checkpoint if not given.",
+    )
+    parser.add_argument("--num-prompts", type=int, default=16)
+    parser.add_argument(
+        "--min-iou",
+        type=float,
+        default=0.99,
+        help="Fail if the minimum IoU falls below this value.",
+    )
+    args = parser.parse_args()
+
+    sam = sam_model_registry[args.model_type](args.checkpoint)
+    images = [np.array(PILImage.open(path).convert("RGB")) for path in args.images]
+    candidate = build_decoder(sam, args.backend, args.onnx_model, args.precision)
+    report = check_decoder_parity(sam, images, candidate, args.num_prompts)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    return 0 if report["min_iou"] >= args.min_iou else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
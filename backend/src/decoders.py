@@ -0,0 +1,208 @@
+from segment_anything.modeling import Sam
+from segment_anything.utils.onnx import SamOnnxModel
+from typing import List, Optional, Tuple
+from .encoders import precisions
+from .logger import logger
+from .scheduler import DecodeRequest
+import inspect
+import io
+import numpy as np
+import time
+import torch
+import warnings
+
+try:
+    import onnxruntime  # type: ignore
+
+    onnxruntime_exists = True
+except ImportError:
+    onnxruntime_exists = False
+
+decoder_backends = ["torch", "onnx"]
+
+
+class TorchMaskDecoder:
+    def __init__(self, sam: Sam, precision: str = "float32"):
+        assert precision in precisions, f"Unknown precision {precision}."
+        self.sam = sam
+        self.dtype = precisions[precision]
+
+    def embed_prompts(
+        self, requests: List[DecodeRequest]
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        first = requests[0]
+        points = None
+        if first.point_coords is not None:
+            points = (
+                torch.cat([r.point_coords for r in requests], dim=0),
+                torch.cat([r.point_labels for r in requests], dim=0),
+            )
+        boxes = None
+        if first.boxes is not None:
+            boxes = torch.cat([r.boxes for r in requests], dim=0)
+        mask_input = None
+        if first.mask_input is not None:
+            mask_input = torch.cat([r.mask_input for r in requests], dim=0)
+
+        # Positional encodings of click coordinates need float32 precision
+        return self.sam.prompt_encoder(points=points, boxes=boxes, masks=mask_input)
+
+    @torch.no_grad()
+    def decode(self, requests: List[DecodeRequest]) -> None:
+        first = requests[0]
+        if first.sparse_embeddings is not None:
+            sparse_embeddings = torch.cat([r.sparse_embeddings for r in requests])
+            dense_embeddings = torch.cat([r.dense_embeddings for r in requests])
+        else:
+            sparse_embeddings, dense_embeddings = self.embed_prompts(requests)
+        image_pe = self.sam.prompt_encoder.get_dense_pe()
+        image_embeddings = torch.cat([r.features for r in requests], dim=0)
+        with torch.autocast(
+            image_embeddings.device.type,
+            dtype=self.dtype,
+            enabled=self.dtype != torch.float32,
+        ):
+            low_res_masks, iou_predictions = self.sam.mask_decoder(
+                image_embeddings=image_embeddings,
+                image_pe=image_pe,
+                sparse_prompt_embeddings=sparse_embeddings,
+                dense_prompt_embeddings=dense_embeddings,
+                multimask_output=first.multimask_output,
+            )
+        low_res_masks, iou_predictions = low_res_masks.float(), iou_predictions.float()
+        if len(requests) > 1:
+            logger.debug(f"Decoded batch of {len(requests)} requests")
+
+        # Upscaling depends on each image's size, so fan out before postprocessing
+        for i, request in enumerate(requests):
+            low_res = low_res_masks[i : i + 1]
+            if request.crop_masks:
+                masks, request.mask_offset = self.sam.postprocess_masks_roi(
+                    low_res, request.input_size, request.original_size
+                )
+            else:
+                masks = self.sam.postprocess_masks(
+                    low_res, request.input_size, request.original_size
+                )
+            masks = masks > self.sam.mask_threshold
+            request.future.set_result((masks, iou_predictions[i : i + 1], low_res))
+
+
+def export_onnx_decoder(sam: Sam, opset: int = 17) -> bytes:
+    onnx_model = SamOnnxModel(model=sam, return_single_mask=False)
+    embed_dim = sam.prompt_encoder.embed_dim
+    embed_size = sam.prompt_encoder.image_embedding_size
+    mask_input_size = [4 * x for x in embed_size]
+    dummy_inputs = {
+        "image_embeddings": torch.randn(1, embed_dim, *embed_size, dtype=torch.float),
+        "point_coords": torch.randint(
+            low=0, high=1024, size=(1, 5, 2), dtype=torch.float
+        ),
+        "point_labels": torch.randint(low=0, high=4, size=(1, 5), dtype=torch.float),
+        "mask_input": torch.randn(1, 1, *mask_input_size, dtype=torch.float),
+        "has_mask_input": torch.tensor([1], dtype=torch.float),
+        "orig_im_size": torch.tensor([1500, 2250], dtype=torch.float),
+    }
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # SamOnnxModel is written for the tracing exporter
+        export_kwargs["dynamo"] = False
+
+    f = io.BytesIO()
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=torch.jit.TracerWarning)
+        warnings.filterwarnings("ignore", category=UserWarning)
+        torch.onnx.export(
+            onnx_model,
+            tuple(dummy_inputs.values()),
+            f,
+            export_params=True,
+            verbose=False,
+            opset_version=opset,
+            do_constant_folding=True,
+            input_names=list(dummy_inputs.keys()),
+            output_names=["masks", "iou_predictions", "low_res_masks"],
+            dynamic_axes={
+                "point_coords": {1: "num_points"},
+                "point_labels": {1: "num_points"},
+            },
+            **export_kwargs,
+        )
+    return f.getvalue()
+
+
+class OnnxMaskDecoder:
+    # Expects a model exported by scripts/export_onnx_model.py without
+    # --return-single-mask, so mask selection matches the torch path
+    def __init__(self, sam: Sam, model_path: Optional[str] = None):
+        assert onnxruntime_exists, "onnxruntime is required for the onnx decoder."
+        self.mask_threshold = sam.mask_threshold
+        self.mask_input_size = [4 * x for x in sam.prompt_encoder.image_embedding_size]
+        if model_path is None:
+            start = time.perf_counter()
+            model = export_onnx_decoder(sam)
+            logger.info(f"Exported onnx decoder in {time.perf_counter() - start:.3f}s")
+        else:
+            model = model_path
+        self.session = onnxruntime.InferenceSession(
+            model, providers=["CPUExecutionProvider"]
+        )
+
+    def decode(self, requests: List[DecodeRequest]) -> None:
+        # The exported model takes a single image embedding per run and always
+        # upscales to the full image, so crop_masks keeps a zero offset
+        for request in requests:
+            request.future.set_result(self._decode(request))
+
+    def _decode(self, request: DecodeRequest):
+        coords = np.zeros((1, 0, 2), dtype=np.float32)
+        labels = np.zeros((1, 0), dtype=np.float32)
+        if request.point_coords is not None:
+            coords = request.point_coords.cpu().numpy().astype(np.float32)
+            labels = request.point_labels.cpu().numpy().astype(np.float32)
+        if request.boxes is None:
+            # The prompt encoder pads point prompts that come without a box
+            coords = np.concatenate([coords, np.zeros((1, 1, 2), np.float32)], axis=1)
+            labels = np.concatenate([labels, -np.ones((1, 1), np.float32)], axis=1)
+        else:
+            box = request.boxes.cpu().numpy().astype(np.float32).reshape(1, 2, 2)
+            coords = np.concatenate([coords, box], axis=1)
+            labels = np.concatenate([labels, np.array([[2, 3]], np.float32)], axis=1)
+
+        if request.mask_input is not None:
+            mask_input = request.mask_input.cpu().numpy().astype(np.float32)
+            has_mask_input = np.ones(1, dtype=np.float32)
+        else:
+            mask_input = np.zeros((1, 1, *self.mask_input_size), dtype=np.float32)
+            has_mask_input = np.zeros(1, dtype=np.float32)
+
+        masks, iou_predictions, low_res_masks = self.session.run(
+            None,
+            {
+                "image_embeddings": request.features.float().cpu().numpy(),
+                "point_coords": coords,
+                "point_labels": labels,
+                "mask_input": mask_input,
+                "has_mask_input": has_mask_input,
+                "orig_im_size": np.array(request.original_size, dtype=np.float32),
+            },
+        )
+
+        # Same token selection as MaskDecoder.forward
+        mask_slice = slice(1, None) if request.multimask_output else slice(0, 1)
+        masks = torch.from_numpy(masks[:, mask_slice]) > self.mask_threshold
+        iou_predictions = torch.from_numpy(iou_predictions[:, mask_slice])
+        low_res_masks = torch.from_numpy(low_res_masks[:, mask_slice])
+        return masks, iou_predictions, low_res_masks
+
+
+def build_decoder(
+    sam: Sam,
+    backend: str = "torch",
+    onnx_model: Optional[str] = None,
+    precision: str = "float32",
+):
+    assert backend in decoder_backends, f"Unknown decoder backend {backend}."
+    if backend == "onnx":
+        return OnnxMaskDecoder(sam, model_path=onnx_model)
+    return TorchMaskDecoder(sam, precision)
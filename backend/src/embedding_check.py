@@ -0,0 +1,165 @@
+from segment_anything import sam_model_registry, SamPredictor
+from segment_anything.modeling import Sam
+from typing import Callable, List, Tuple
+from PIL import Image as PILImage
+from .config import defaultEmbeddingConfig, defaultPredictorConfig
+from .encoders import AutocastImageEncoder, build_encoder, precisions
+from .utils.tensorBytes import DTYPE_CODES, tensor_from_bytes, tensor_to_bytes
+import argparse
+import numpy as np
+import sys
+import time
+import torch
+
+
+def mask_iou(mask_a: np.ndarray, mask_b: np.ndarray) -> float:
+    union = np.logical_or(mask_a, mask_b).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(mask_a, mask_b).sum() / union)
+
+
+def sample_points(
+    image_size: Tuple[int, int], num_points: int, rng: np.random.Generator
+) -> np.ndarray:
+    h, w = image_size
+    return rng.uniform((0, 0), (w, h), size=(num_points, 1, 2))
+
+
+def compare_embeddings(
+    predictor: SamPredictor,
+    reference: torch.Tensor,
+    candidate: torch.Tensor,
+    original_size: Tuple[int, int],
+    input_size: Tuple[int, int],
+    points: np.ndarray,
+) -> List[float]:
+    ious = []
+    for point in points:
+        masks = []
+        for features in (reference, candidate):
+            predictor.set_image_embedding(features, original_size, input_size)
+            mask, _, _ = predictor.predict(
+                point_coords=point, point_labels=np.array([1]), multimask_output=False
+            )
+            masks.append(mask[0])
+        ious.append(mask_iou(*masks))
+    return ious
+
+
+def check_embedding_dtype(
+    sam: Sam,
+    images: List[np.ndarray],
+    dtype: str = defaultEmbeddingConfig.dtype,
+    num_points: int = 16,
+    seed: int = 0,
+) -> dict:
+    predictor = SamPredictor(sam)
+    rng = np.random.default_rng(seed)
+    ious = []
+    stored_bytes = 0
+    for image in images:
+        predictor.set_image(image)
+        reference = predictor.features
+        original_size, input_size = predictor.original_size, predictor.input_size
+        data = tensor_to_bytes(reference, dtype=dtype)
+        stored_bytes += len(data)
+        candidate = tensor_from_bytes(data).to(reference.device)
+        points = sample_points(original_size, num_points, rng)
+        ious += compare_embeddings(
+            predictor, reference, candidate, original_size, input_size, points
+        )
+    return {
+        "dtype": dtype,
+        "num_images": len(images),
+        "num_masks": len(ious),
+        "mean_iou": float(np.mean(ious)),
+        "min_iou": float(np.min(ious)),
+        "bytes_per_embedding": stored_bytes / len(images),
+    }
+
+
+def check_image_encoder(
+    sam: Sam,
+    images: List[np.ndarray],
+    image_encoder: Callable[[torch.Tensor], torch.Tensor],
+    num_points: int = 16,
+    seed: int = 0,
+) -> dict:
+    predictor = SamPredictor(sam)
+    candidate_predictor = SamPredictor(sam, image_encoder)
+    rng = np.random.default_rng(seed)
+    ious = []
+    timings = {"reference": [], "candidate": []}
+    for image in images:
+        start = time.perf_counter()
+        predictor.set_image(image)
+        timings["reference"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        candidate_predictor.set_image(image)
+        timings["candidate"].append(time.perf_counter() - start)
+
+        reference = predictor.features
+        candidate = candidate_predictor.features.to(reference.dtype)
+        original_size, input_size = predictor.original_size, predictor.input_size
+        points = sample_points(original_size, num_points, rng)
+        ious += compare_embeddings(
+            predictor, reference, candidate, original_size, input_size, points
+        )
+    return {
+        "num_images": len(images),
+        "num_masks": len(ious),
+        "mean_iou": float(np.mean(ious)),
+        "min_iou": float(np.min(ious)),
+        **{f"{name}_s": float(np.mean(t)) for name, t in timings.items()},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Report mask IoU of stored or alternatively encoded embeddings "
+            "against float embeddings."
+        )
+    )
+    parser.add_argument("images", nargs="+", help="Sample images to encode.")
+    parser.add_argument("--dtype", default="int8", choices=list(DTYPE_CODES))
+    parser.add_argument("--model-type", default=defaultPredictorConfig.model_type)
+    parser.add_argument("--checkpoint", default=defaultPredictorConfig.sam_checkpoint)
+    parser.add_argument("--num-points", type=int, default=16)
+    parser.add_argument(
+        "--encoder-onnx-model",
+        default=None,
+        help="Compare this exported image encoder instead of a storage dtype.",
+    )
+    parser.add_argument(
+        "--encoder-precision",
+        default="float32",
+        choices=list(precisions),
+        help="Compare autocast encoding in this precision instead of a storage dtype.",
+    )
+    parser.add_argument(
+        "--min-iou",
+        type=float,
+        default=0.95,
+        help="Fail if the mean IoU falls below this value.",
+    )
+    args = parser.parse_args()
+
+    sam = sam_model_registry[args.model_type](args.checkpoint)
+    images = [np.array(PILImage.open(path).convert("RGB")) for path in args.images]
+    if args.encoder_onnx_model is not None:
+        image_encoder = build_encoder("onnx", args.encoder_onnx_model)
+        report = check_image_encoder(sam, images, image_encoder, args.num_points)
+    elif args.encoder_precision != "float32":
+        image_encoder = AutocastImageEncoder(sam.image_encoder, args.encoder_precision)
+        report = check_image_encoder(sam, images, image_encoder, args.num_points)
+    else:
+        report = check_embedding_dtype(sam, images, args.dtype, args.num_points)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    return 0 if report["mean_iou"] >= args.min_iou else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+from segment_anything import SamPredictor
+from segment_anything.modeling import Sam
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from .logger import logger
+import numpy as np
+import os
+import threading
+import time
+import torch
+
+# (features, original_size, input_size) of an encoded image
+EncodedImage = Tuple[torch.Tensor, Tuple[int, int], Tuple[int, int]]
+# Returns the image, or the image decoded at reduced size with the full size
+ImageLoader = Callable[[], Union[np.ndarray, Tuple[np.ndarray, Tuple[int, int]]]]
+
+
+class EncoderPool:
+    def __init__(
+        self,
+        sam: Sam,
+        num_workers: int = 1,
+        cpu_affinity: Optional[List[int]] = None,
+        image_encoder: Optional[Callable[[torch.Tensor], torch.Tensor]] = None,
+    ):
+        self.sam = sam
+        self.image_encoder = image_encoder
+        self.cpu_affinity = cpu_affinity
+        # In-flight jobs by key, so the same image is never encoded twice at once
+        self.jobs: Dict[str, Future] = {}
+        self.jobs_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=num_workers,
+            thread_name_prefix="image-encoder",
+            initializer=self._pin_worker,
+        )
+
+    def _pin_worker(self) -> None:
+        # Threads spawned by torch inherit the affinity of the worker thread
+        if self.cpu_affinity and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, self.cpu_affinity)
+
+    def _encode(
+        self, load_image: ImageLoader, features: torch.Tensor = None
+    ) -> EncodedImage:
+        start = time.perf_counter()
+        predictor = SamPredictor(self.sam, self.image_encoder)
+        image, original_size = load_image(), None
+        if isinstance(image, tuple):
+            # Pixels decoded at reduced size, with the full image size
+            image, original_size = image
+        predictor.set_image(image, features=features, original_size=original_size)
+        logger.debug(f"Encoded image in {time.perf_counter() - start:.3f}s")
+        return predictor.features, predictor.original_size, predictor.input_size
+
+    def submit(
+        self,
+        load_image: ImageLoader,
+        features: torch.Tensor = None,
+        key: str = None,
+    ) -> Future:
+        if key is None:
+            return self.executor.submit(self._encode, load_image, features)
+
+        with self.jobs_lock:
+            job = self.jobs.get(key)
+            if job is not None and features is None:
+                return job
+            job = self.executor.submit(self._encode, load_image, features)
+            self.jobs[key] = job
+        job.add_done_callback(lambda _: self._forget(key, job))
+        return job
+
+    def _encode_batch(
+        self, load_images: List[ImageLoader], jobs: List[Future], batch_size: int
+    ) -> None:
+        start = time.perf_counter()
+        images, original_sizes, loaded_jobs = [], [], []
+        for load_image, job in zip(load_images, jobs):
+            try:
+                image, original_size = load_image(), None
+            except Exception as e:
+                job.set_exception(e)
+                continue
+            if isinstance(image, tuple):
+                image, original_size = image
+            images.append(image)
+            original_sizes.append(original_size)
+            loaded_jobs.append(job)
+        if len(images) == 0:
+            return
+
+        predictor = SamPredictor(self.sam, self.image_encoder)
+        try:
+            encoded = predictor.encode_images(
+                images, batch_size, original_sizes=original_sizes
+            )
+        except Exception as e:
+            for job in loaded_jobs:
+                job.set_exception(e)
+            return
+        for job, result in zip(loaded_jobs, encoded):
+            # A copy, so a kept embedding does not hold on to the whole batch
+            job.set_result(
+                (
+                    result["features"].clone(),
+                    result["original_size"],
+                    result["input_size"],
+                )
+            )
+        logger.debug(
+            f"Encoded batch of {len(images)} images in "
+            f"{time.perf_counter() - start:.3f}s"
+        )
+
+    def submit_batch(
+        self, load_images: Dict[str, ImageLoader], batch_size: int = 4
+    ) -> Dict[str, Future]:
+        # Images run through the encoder batch_size at a time in one job.
+        # Keys already in flight are joined instead of encoded again.
+        jobs, new_jobs = {}, {}
+        with self.jobs_lock:
+            for key in load_images:
+                job = self.jobs.get(key)
+                if job is None:
+                    job = Future()
+                    self.jobs[key] = job
+                    new_jobs[key] = job
+                jobs[key] = job
+        for key, job in new_jobs.items():
+            job.add_done_callback(lambda _, key=key, job=job: self._forget(key, job))
+        if len(new_jobs) > 0:
+            self.executor.submit(
+                self._encode_batch,
+                [load_images[key] for key in new_jobs],
+                list(new_jobs.values()),
+                batch_size,
+            )
+        return jobs
+
+    def _forget(self, key: str, job: Future) -> None:
+        with self.jobs_lock:
+            if self.jobs.get(key) is job:
+                del self.jobs[key]
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,60 @@
+from typing import Callable, Optional
+import numpy as np
+import torch
+
+try:
+    import onnxruntime  # type: ignore
+
+    onnxruntime_exists = True
+except ImportError:
+    onnxruntime_exists = False
+
+encoder_backends = ["torch", "onnx"]
+precisions = {
+    "float32": torch.float32,
+    "bfloat16": torch.bfloat16,
+    "float16": torch.float16,
+}
+
+
+class AutocastImageEncoder:
+    # Sam.preprocess runs before the encoder, so normalisation stays float32
+    def __init__(
+        self, image_encoder: Callable[[torch.Tensor], torch.Tensor], precision: str
+    ):
+        assert precision in precisions, f"Unknown precision {precision}."
+        self.image_encoder = image_encoder
+        self.dtype = precisions[precision]
+
+    def __call__(self, input_image: torch.Tensor) -> torch.Tensor:
+        with torch.autocast(input_image.device.type, dtype=self.dtype):
+            image_embeddings = self.image_encoder(input_image)
+        return image_embeddings.float()
+
+
+class OnnxImageEncoder:
+    # Runs a model from scripts/export_onnx_encoder.py, plain or quantized
+    def __init__(self, model_path: str):
+        assert onnxruntime_exists, "onnxruntime is required for the onnx encoder."
+        self.session = onnxruntime.InferenceSession(
+            model_path, providers=["CPUExecutionProvider"]
+        )
+
+    def __call__(self, input_image: torch.Tensor) -> torch.Tensor:
+        # The exported graph has a fixed batch size of one
+        image_embeddings = [
+            self.session.run(None, {"input_image": x[None].float().cpu().numpy()})[0]
+            for x in input_image
+        ]
+        return torch.from_numpy(np.concatenate(image_embeddings)).to(input_image.device)
+
+
+def build_encoder(
+    backend: str = "torch", onnx_model: Optional[str] = None
+) -> Optional[OnnxImageEncoder]:
+    # None keeps the torch image encoder of the model
+    assert backend in encoder_backends, f"Unknown encoder backend {backend}."
+    if backend == "onnx":
+        assert onnx_model is not None, "The onnx encoder needs an exported model."
+        return OnnxImageEncoder(onnx_model)
+    return None
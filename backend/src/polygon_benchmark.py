@@ -0,0 +1,80 @@
+from typing import List
+from .utils.polygons import masks_to_polygons
+import argparse
+import cv2
+import numpy as np
+import sys
+import time
+
+
+def synthetic_masks(
+    num_masks: int, height: int, width: int, seed: int = 0
+) -> np.ndarray:
+    # Blobs of varying size, some with a hole, like automatic mask generator output
+    rng = np.random.default_rng(seed)
+    masks = np.zeros((num_masks, height, width), dtype=bool)
+    for mask in masks:
+        y, x = rng.integers(0, height), rng.integers(0, width)
+        axes = rng.integers(8, min(height, width) // 4, size=2)
+        angle = rng.uniform(0, 180)
+        canvas = mask.view(np.uint8)
+        cv2.ellipse(
+            canvas, (int(x), int(y)), tuple(map(int, axes)), angle, 0, 360, 1, -1
+        )
+        if rng.random() < 0.5:
+            inner = tuple(int(a) // 3 for a in axes)
+            cv2.ellipse(canvas, (int(x), int(y)), inner, angle, 0, 360, 0, -1)
+    return masks
+
+
+def legacy_polygons(masks: np.ndarray) -> List[list]:
+    # The previous per mask path: full frame contours with a 1% epsilon
+    polygons = []
+    for mask in masks:
+        contours, _ = cv2.findContours(
+            255 * np.uint8(mask), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        )
+        vertices = []
+        for contour in contours:
+            epsilon = 0.01 * cv2.arcLength(contour, True)
+            vertices.append(cv2.approxPolyDP(contour, epsilon, True).reshape(-1, 2))
+        polygons.append(vertices)
+    return polygons
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Measure mask to polygon throughput on synthetic 4K masks."
+    )
+    parser.add_argument("--num-masks", type=int, default=64)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--tolerance", type=float, default=1.0)
+    parser.add_argument("--min-area", type=float, default=0.0)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    masks = synthetic_masks(args.num_masks, args.height, args.width)
+    runs = {
+        "legacy": lambda: legacy_polygons(masks),
+        "batched": lambda: masks_to_polygons(
+            masks, tolerance=args.tolerance, min_area=args.min_area
+        ),
+    }
+    for name, run in runs.items():
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            polygons = run()
+            timings.append(time.perf_counter() - start)
+        elapsed = min(timings)
+        num_polygons = sum(len(p) for p in polygons)
+        print(
+            f"{name}: {args.num_masks / elapsed:.1f} masks/s, "
+            f"{1000 * elapsed / args.num_masks:.2f} ms/mask, {num_polygons} polygons"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
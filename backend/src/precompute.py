@@ -0,0 +1,138 @@
+from typing import Dict, List, Optional, Tuple
+from .Database import Database
+from .logger import logger
+from .predictor import PredictorWrapper
+from .utils.imageDecoder import DecodedImage
+import functools
+import heapq
+import itertools
+import threading
+
+
+class EmbeddingPrecomputer:
+    orders = ["upload", "current"]
+
+    def __init__(
+        self,
+        database: Database,
+        predictor: PredictorWrapper,
+        order: str = "upload",
+        lookahead: int = 5,
+        enabled: bool = True,
+        batch_size: int = 4,
+    ):
+        assert order in self.orders, f"Unknown precompute order {order}."
+        self.database = database
+        self.predictor = predictor
+        self.order = order
+        self.lookahead = lookahead
+        self.enabled = enabled
+        self.batch_size = batch_size
+
+        # Heap of (priority, image_id); entries whose priority no longer matches
+        # self.queued are stale and skipped when popped
+        self.heap: List[Tuple[Tuple[int, int], str]] = []
+        self.queued: Dict[str, Tuple[int, int]] = {}
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.worker = threading.Thread(
+            target=self._run, name="embedding-precompute", daemon=True
+        )
+        self.worker.start()
+
+    def _push(self, image_id: str, priority: Tuple[int, int]) -> None:
+        self.queued[image_id] = priority
+        heapq.heappush(self.heap, (priority, image_id))
+
+    def enqueue(self, image_ids: List[str]) -> None:
+        if not self.enabled:
+            return
+        with self.condition:
+            for image_id in image_ids:
+                if image_id not in self.queued:
+                    self._push(image_id, (1, next(self.counter)))
+            self.condition.notify()
+        logger.debug(f"Queued {len(image_ids)} images for embedding precomputation")
+
+    def prioritize(self, image_ids: List[str]) -> None:
+        # Queued images jump ahead of the upload order, in the given order
+        with self.condition:
+            for image_id in image_ids:
+                if image_id in self.queued:
+                    self._push(image_id, (0, next(self.counter)))
+
+    def discard(self, image_id: str) -> None:
+        with self.condition:
+            self.queued.pop(image_id, None)
+
+    def on_image_opened(self, project_id: str, image_id: str) -> None:
+        # The annotator's own request encodes this image, precompute what follows
+        self.discard(image_id)
+        if self.order != "current" or not self.queued:
+            return
+        project = self.database.get_project(project_id)
+        self.prioritize(project.getFollowingImageIDs(image_id, self.lookahead))
+
+    def _pop(self) -> Optional[str]:
+        # Called with the condition held, skips stale heap entries
+        while self.heap:
+            priority, image_id = heapq.heappop(self.heap)
+            if self.queued.get(image_id) == priority:
+                del self.queued[image_id]
+                return image_id
+        return None
+
+    def _next_batch(self) -> List[str]:
+        # Waits for one image, then takes whatever else is queued up to batch_size
+        with self.condition:
+            image_id = self._pop()
+            while image_id is None:
+                self.condition.wait()
+                image_id = self._pop()
+            image_ids = [image_id]
+            while len(image_ids) < self.batch_size:
+                image_id = self._pop()
+                if image_id is None:
+                    break
+                image_ids.append(image_id)
+        return image_ids
+
+    def _needs_embeddings(self, image_id: str) -> bool:
+        if self.database.has_image_embeddings(image_id):
+            return False
+        # Tiled images are encoded per tile when annotated, not as a whole
+        metadata = self.database.get_image_metadata(image_id)
+        return not self.predictor.use_tiles((metadata.height, metadata.width))
+
+    def _load_image(self, image_id: str) -> DecodedImage:
+        img_size = self.predictor.sam.image_encoder.img_size
+        return self.database.get_image(image_id).reduced_ndarray(img_size)
+
+    def _precompute(self, image_ids: List[str]) -> None:
+        load_images = {}
+        for image_id in image_ids:
+            try:
+                if not self._needs_embeddings(image_id):
+                    continue
+            except KeyError:
+                logger.info(f"Image {image_id} removed before precomputing embeddings")
+                continue
+            load_images[image_id] = functools.partial(self._load_image, image_id)
+
+        jobs = self.predictor.encode_batch(load_images, self.batch_size)
+        for image_id, job in jobs.items():
+            try:
+                self.database.set_image_embeddings(image_id, job.result()[0])
+                logger.debug(f"Precomputed embeddings for image {image_id}")
+            except KeyError:
+                logger.info(f"Image {image_id} removed before precomputing embeddings")
+            except Exception:
+                logger.exception(f"Failed to precompute embeddings for {image_id}")
+
+    def _run(self) -> None:
+        while True:
+            image_ids = self._next_batch()
+            try:
+                self._precompute(image_ids)
+            except Exception:
+                logger.exception(f"Failed to precompute embeddings for {image_ids}")
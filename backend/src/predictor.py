@@ -1,58 +1,256 @@
-from segment_anything import sam_model_registry, SamPredictor
+from segment_anything import sam_model_registry, SamPredictor, TiledSamPredictor
+from segment_anything.modeling import Sam
+from segment_anything.utils.transforms import ResizeLongestSide
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from .compilation import compile_sam
+from .config import defaultPredictorConfig
+from .decoders import build_decoder
+from .encoder_pool import EncodedImage, EncoderPool, ImageLoader
+from .encoders import AutocastImageEncoder, build_encoder
 from .logger import logger
+from .scheduler import DecodeRequest, DecoderScheduler
+from .utils.lruCache import LRUCache
+import threading
+import time
 import torch
 
 
-class PredictorWrapper:
+class PredictorSession:
     def __init__(
         self,
-        model_type: str = "vit_b",
-        sam_checkpoint: str = "segment-anything/sam_vit_b_01ec64.pth",
-        device: str = None,
+        sam: Sam,
+        scheduler: DecoderScheduler,
+        embed_prompts: bool = True,
     ):
-        sam = sam_model_registry[model_type](sam_checkpoint)
-        if device == "cuda":
-            sam.to(device=device)
         self.predictor = SamPredictor(sam)
+        self.scheduler = scheduler
+        self.embed_prompts = embed_prompts
+        self.image_id = None
+        self.pending_image: Optional[Future] = None
+        # Tiled images resolve to a TiledSamPredictor instead of an embedding
+        self.is_tiled = False
+        self.tiled_predictor: Optional[TiledSamPredictor] = None
+        self.lock = threading.Lock()
         self.points = []
         self.points_label = []
         self.mask_input = None
+        self.tile_mask_inputs = None
         self.input_box = None
+        self.reset_prompt_embeddings()
 
-    def set_image(self, image: np.ndarray, features: torch.Tensor = None):
-        image_embeddings = self.predictor.set_image(image, features=features)
-        logger.debug("Image set")
-        return image_embeddings
+    def set_pending_image(
+        self,
+        image_id: str,
+        pending_image: Future,
+        is_tiled: bool = False,
+    ) -> None:
+        with self.lock:
+            self.reset_annotation()
+            self.predictor.reset_image()
+            self.tiled_predictor = None
+            self.image_id = image_id
+            self.pending_image = pending_image
+            self.is_tiled = is_tiled
+
+    def wait_for_image(self) -> bool:
+        # Prompts sent while the image is being encoded wait here instead of failing
+        pending_image = self.pending_image
+        if pending_image is None:
+            return self.is_image_set
+        try:
+            result = pending_image.result()
+        except Exception:
+            logger.exception(f"Encoding image {self.image_id} failed")
+            return False
+
+        with self.lock:
+            if self.pending_image is pending_image:
+                if isinstance(result, TiledSamPredictor):
+                    self.tiled_predictor = result
+                else:
+                    self.predictor.set_image_embedding(*result)
+                self.pending_image = None
+                logger.debug(f"Image {self.image_id} set")
+        return self.is_image_set
 
     @property
     def is_image_set(self):
-        return self.predictor.is_image_set
+        return self.predictor.is_image_set or self.tiled_predictor is not None
+
+    @property
+    def original_size(self) -> Optional[Tuple[int, int]]:
+        tiled_predictor = self.tiled_predictor
+        if tiled_predictor is not None:
+            return tiled_predictor.original_size
+        return self.predictor.original_size
 
-    def predict(self):
-        if not self.is_image_set:
+    @property
+    def features(self) -> Optional[torch.Tensor]:
+        return self.predictor.features
+
+    @property
+    def encoded_image(self) -> Optional[EncodedImage]:
+        # Tiled images have no embedding of the whole image to share
+        if not self.predictor.is_image_set:
+            return None
+        predictor = self.predictor
+        return predictor.features, predictor.original_size, predictor.input_size
+
+    def predict(self) -> Optional[np.ndarray]:
+        result = self.decode()
+        return None if result is None else result[0]
+
+    def predict_crop(self) -> Optional[Tuple[np.ndarray, Tuple[int, int]]]:
+        # Masks cover only the predicted region, offset by (top, left)
+        return self.decode(crop_masks=True)
+
+    def decode(
+        self, crop_masks: bool = False
+    ) -> Optional[Tuple[np.ndarray, Tuple[int, int]]]:
+        if not self.wait_for_image():
             logger.warning("No image set for prediction")
             return None
+        if self.tiled_predictor is not None:
+            return self.decode_tiles(crop_masks)
 
-        masks, scores, logits = self.predictor.predict(
-            point_coords=self.points,
-            point_labels=self.points_label,
-            box=self.input_box,
-            mask_input=self.mask_input,
-            multimask_output=False,
+        point_coords, point_labels = None, None
+        if len(self.points) > 0:
+            point_coords = np.asarray(self.points)
+            point_labels = np.asarray(self.points_label)
+        coords, labels, box, mask_input = self.predictor.prepare_prompts(
+            point_coords, point_labels, self.input_box, self.mask_input
+        )
+        sparse_embeddings, dense_embeddings = None, None
+        if self.embed_prompts:
+            sparse_embeddings, dense_embeddings = self.get_prompt_embeddings(
+                coords, labels, box, mask_input
+            )
+        request = DecodeRequest(
+            features=self.predictor.features,
+            input_size=self.predictor.input_size,
+            original_size=self.predictor.original_size,
+            point_coords=coords,
+            point_labels=labels,
+            boxes=box,
+            mask_input=mask_input,
+            sparse_embeddings=sparse_embeddings,
+            dense_embeddings=dense_embeddings,
+            crop_masks=crop_masks,
         )
+        masks, scores, logits = self.scheduler.predict(request)
+
+        masks = masks[0].cpu().numpy()
+        scores = scores[0].cpu().numpy()
+        logits = logits[0].cpu().numpy()
         self.mask_input = logits[np.argmax(scores), :, :][None, :, :]
-        return masks
+        self.mask_embeddings = None
+        return masks, request.mask_offset
+
+    def decode_tiles(
+        self, crop_masks: bool = False
+    ) -> Optional[Tuple[np.ndarray, Tuple[int, int]]]:
+        # Tiles are encoded in the encoder pool on the first prompt reaching
+        # them. The lock is not held meanwhile, a tiled predictor replaced by
+        # another image is simply dropped.
+        point_coords, point_labels, box = None, None, None
+        if len(self.points) > 0:
+            point_coords = np.asarray(self.points, dtype=np.float32).reshape(-1, 2)
+            point_labels = np.asarray(self.points_label).reshape(-1)
+        if self.input_box is not None:
+            box = np.asarray(self.input_box, dtype=np.float32).reshape(4)
+        if point_coords is None and box is None:
+            logger.warning("No prompts set for prediction")
+            return None
+
+        tiled_predictor = self.tiled_predictor
+        if tiled_predictor is None:
+            return None
+        if len(tiled_predictor.select_tiles(point_coords, point_labels, box)) == 0:
+            logger.warning("Prompts spanning several tiles need a positive point")
+            return None
+        masks, _, offset = tiled_predictor.predict(
+            point_coords,
+            point_labels,
+            box,
+            mask_inputs=self.tile_mask_inputs,
+            multimask_output=False,
+        )
+        with self.lock:
+            if self.tiled_predictor is not tiled_predictor:
+                logger.warning(f"Image replaced while predicting on {self.image_id}")
+                return None
+            self.tile_mask_inputs = tiled_predictor.low_res_logits
+        original_size = tiled_predictor.original_size
+
+        if not crop_masks:
+            top, left = offset
+            full_masks = np.zeros((len(masks), *original_size), dtype=bool)
+            bottom, right = top + masks.shape[1], left + masks.shape[2]
+            full_masks[:, top:bottom, left:right] = masks
+            masks, offset = full_masks, (0, 0)
+        return masks, offset
+
+    @torch.no_grad()
+    def get_prompt_embeddings(
+        self,
+        coords: Optional[torch.Tensor],
+        labels: Optional[torch.Tensor],
+        box: Optional[torch.Tensor],
+        mask_input: Optional[torch.Tensor],
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        # Points embed independently, so each click only encodes the new points
+        prompt_encoder = self.predictor.model.prompt_encoder
+        point_embeddings = None
+        if coords is not None:
+            num_embedded = 0
+            if self.point_embeddings is not None:
+                num_embedded = self.point_embeddings.shape[1]
+            if num_embedded > coords.shape[1]:
+                self.point_embeddings, num_embedded = None, 0
+            if coords.shape[1] > num_embedded:
+                new_embeddings = prompt_encoder.embed_points(
+                    coords[:, num_embedded:], labels[:, num_embedded:]
+                )
+                if self.point_embeddings is not None:
+                    new_embeddings = torch.cat(
+                        [self.point_embeddings, new_embeddings], dim=1
+                    )
+                self.point_embeddings = new_embeddings
+            point_embeddings = self.point_embeddings
+        if box is not None and self.box_embeddings is None:
+            self.box_embeddings = prompt_encoder.embed_boxes(box)
+        if mask_input is not None and self.mask_embeddings is None:
+            self.mask_embeddings = prompt_encoder.embed_masks(mask_input)
+        return prompt_encoder.combine_embeddings(
+            point_embeddings,
+            self.box_embeddings if box is not None else None,
+            self.mask_embeddings if mask_input is not None else None,
+        )
+
+    def reset_prompt_embeddings(self):
+        self.point_embeddings = None
+        self.box_embeddings = None
+        self.mask_embeddings = None
 
     def reset_annotation(self):
         self.points = []
         self.points_label = []
         self.mask_input = None
+        self.tile_mask_inputs = None
         self.input_box = None
+        self.reset_prompt_embeddings()
 
     def reset_image(self):
-        self.reset_annotation()
-        self.predictor.reset_image()
+        with self.lock:
+            self.reset_annotation()
+            self.image_id = None
+            self.pending_image = None
+            self.is_tiled = False
+            self.tiled_predictor = None
+            self.predictor.reset_image()
 
     def add_points(self, points: np.ndarray[np.ndarray], label: np.ndarray):
         if len(points) != len(label):
@@ -65,6 +263,7 @@ class PredictorWrapper:
 
     def set_input_box(self, box: np.ndarray):
         self.input_box = box
+        self.box_embeddings = None
 
     def add_point(self, point: np.ndarray, label: int):
         self.points.append(point)
@@ -76,3 +275,254 @@ class PredictorWrapper:
             return
         self.points = points
         self.points_label = labels
+        self.point_embeddings = None
+
+
+class PredictorWrapper:
+    def __init__(
+        self,
+        model_type: str = defaultPredictorConfig.model_type,
+        sam_checkpoint: str = defaultPredictorConfig.sam_checkpoint,
+        device: str = defaultPredictorConfig.device,
+        decoder_batch_wait_ms: float = defaultPredictorConfig.decoder_batch_wait_ms,
+        decoder_max_batch_size: int = defaultPredictorConfig.decoder_max_batch_size,
+        decoder_backend: str = defaultPredictorConfig.decoder_backend,
+        decoder_onnx_model: str = defaultPredictorConfig.decoder_onnx_model,
+        encoder_workers: int = defaultPredictorConfig.encoder_workers,
+        encoder_cpu_affinity: List[int] = defaultPredictorConfig.encoder_cpu_affinity,
+        encoder_backend: str = defaultPredictorConfig.encoder_backend,
+        encoder_onnx_model: str = defaultPredictorConfig.encoder_onnx_model,
+        embedding_cache_bytes: int = defaultPredictorConfig.embedding_cache_bytes,
+        encoder_precision: str = defaultPredictorConfig.encoder_precision,
+        decoder_precision: str = defaultPredictorConfig.decoder_precision,
+        frozen_inference: bool = defaultPredictorConfig.frozen_inference,
+        compile_mode: str = defaultPredictorConfig.compile_mode,
+        warmup: bool = defaultPredictorConfig.warmup,
+        tiled_min_side: int = defaultPredictorConfig.tiled_min_side,
+        tile_size: int = defaultPredictorConfig.tile_size,
+        tile_overlap: int = defaultPredictorConfig.tile_overlap,
+        max_cached_tiles: int = defaultPredictorConfig.max_cached_tiles,
+        tiled_cached_images: int = defaultPredictorConfig.tiled_cached_images,
+    ):
+        sam = sam_model_registry[model_type](sam_checkpoint)
+        if device == "cuda":
+            sam.to(device=device)
+        sam.set_frozen_inference(frozen_inference)
+        # Model weights are shared, prompt state and embeddings live per session
+        self.sam = sam
+        image_encoder = build_encoder(encoder_backend, encoder_onnx_model)
+        if compile_mode is not None:
+            compiled_encoder = compile_sam(sam, compile_mode)
+            image_encoder = image_encoder or compiled_encoder
+        if encoder_precision != "float32":
+            assert encoder_backend == "torch", "Autocast needs the torch encoder."
+            image_encoder = AutocastImageEncoder(
+                image_encoder or sam.image_encoder, encoder_precision
+            )
+        self.scheduler = DecoderScheduler(
+            build_decoder(sam, decoder_backend, decoder_onnx_model, decoder_precision),
+            batch_wait_ms=decoder_batch_wait_ms,
+            max_batch_size=decoder_max_batch_size,
+        )
+        self.encoder_pool = EncoderPool(
+            sam,
+            num_workers=encoder_workers,
+            cpu_affinity=encoder_cpu_affinity,
+            image_encoder=image_encoder,
+        )
+        self.embedding_cache = LRUCache(
+            embedding_cache_bytes,
+            size_of=lambda encoded_image: encoded_image[0].nbytes,
+        )
+        # Sessions embed prompts incrementally for the torch decoder
+        self.embed_prompts = decoder_backend == "torch"
+        self.tiled_min_side = tiled_min_side
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.max_cached_tiles = max_cached_tiles
+        # Tile embeddings by image, the cache counts images rather than bytes
+        self.tile_caches = LRUCache(tiled_cached_images, size_of=lambda _: 1)
+        self.tile_image_loader = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="tile-image-loader"
+        )
+        self.sessions: Dict[str, PredictorSession] = {}
+        self.sessions_lock = threading.Lock()
+        self.startup_timings: Dict[str, float] = {}
+        if warmup:
+            self.startup_timings = self.warm_up()
+
+    def warm_up(self) -> Dict[str, float]:
+        img_size = self.sam.image_encoder.img_size
+        image = np.zeros((img_size, img_size, 3), dtype=np.uint8)
+        timings = {}
+        start = time.perf_counter()
+        features, original_size, input_size = self.encoder_pool.submit(
+            lambda: image
+        ).result()
+        timings["encode"] = time.perf_counter() - start
+
+        # Prompt layouts of a first click, a follow-up click and a box
+        device = self.sam.device
+        point = torch.full((1, 1, 2), img_size / 2, device=device)
+        label = torch.ones((1, 1), dtype=torch.int, device=device)
+        mask_size = self.sam.prompt_encoder.mask_input_size
+        prompts = {
+            "point": dict(point_coords=point, point_labels=label),
+            "follow_up": dict(
+                point_coords=torch.cat([point, point], dim=1),
+                point_labels=torch.cat([label, 1 - label], dim=1),
+                mask_input=torch.zeros((1, 1, *mask_size), device=device),
+            ),
+            "box": dict(
+                boxes=torch.tensor([[0, 0, img_size - 1, img_size - 1]], device=device)
+            ),
+        }
+        for name, prompt in prompts.items():
+            start = time.perf_counter()
+            self.scheduler.predict(
+                DecodeRequest(features, input_size, original_size, **prompt)
+            )
+            timings[f"decode_{name}"] = time.perf_counter() - start
+        logger.info(
+            "Warmed up predictor: "
+            + ", ".join(f"{name} {t:.3f}s" for name, t in timings.items())
+        )
+        return timings
+
+    def get_session(self, session_id: str) -> PredictorSession:
+        with self.sessions_lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = PredictorSession(
+                    self.sam, self.scheduler, embed_prompts=self.embed_prompts
+                )
+                self.sessions[session_id] = session
+                logger.debug(f"Created predictor session {session_id}")
+            return session
+
+    def remove_session(self, session_id: str) -> None:
+        with self.sessions_lock:
+            session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.reset_image()
+            logger.debug(f"Removed predictor session {session_id}")
+
+    @property
+    def num_sessions(self) -> int:
+        return len(self.sessions)
+
+    def get_shared_image(self, image_id: str) -> Optional[EncodedImage]:
+        with self.sessions_lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            if session.image_id == image_id:
+                encoded_image = session.encoded_image
+                if encoded_image is not None:
+                    return encoded_image
+        return None
+
+    def is_image_cached(self, image_id: str) -> bool:
+        return image_id in self.embedding_cache
+
+    def get_cached_image(self, image_id: str) -> Optional[EncodedImage]:
+        encoded_image = self.embedding_cache.get(image_id)
+        logger.debug(f"Embedding cache: {self.embedding_cache.stats}")
+        return encoded_image
+
+    def cache_image(self, image_id: str, encoded_image: EncodedImage) -> None:
+        self.embedding_cache.put(image_id, encoded_image)
+
+    def forget_image(self, image_id: str) -> None:
+        self.embedding_cache.pop(image_id)
+        self.tile_caches.pop(image_id)
+
+    def use_tiles(self, image_size: Tuple[int, int]) -> bool:
+        if self.tiled_min_side is None:
+            return False
+        return max(image_size) >= self.tiled_min_side
+
+    def set_tiled_image(
+        self, session_id: str, image_id: str, load_image: Callable[[], np.ndarray]
+    ) -> Future:
+        # The full resolution image is loaded in the background. Its tiles are
+        # encoded in the encoder pool as prompts reach them, and their
+        # embeddings are shared by sessions on the same image.
+        tile_embeddings = self.tile_caches.get(image_id)
+        if tile_embeddings is None:
+            tile_embeddings = OrderedDict()
+            self.tile_caches.put(image_id, tile_embeddings)
+
+        def encode_tile(tile: Tuple[int, int], tile_image: np.ndarray):
+            key = f"{image_id}:tile:{tile[0]}:{tile[1]}"
+            return self.encoder_pool.submit(lambda: tile_image, key=key).result()
+
+        def load_tiled_image() -> TiledSamPredictor:
+            tiled_predictor = TiledSamPredictor(
+                self.sam,
+                tile_size=self.tile_size,
+                overlap=self.tile_overlap,
+                max_cached_tiles=self.max_cached_tiles,
+                tile_encoder=encode_tile,
+            )
+            tiled_predictor.set_image(load_image(), tile_embeddings=tile_embeddings)
+            return tiled_predictor
+
+        pending_image = self.tile_image_loader.submit(load_tiled_image)
+        session = self.get_session(session_id)
+        session.set_pending_image(image_id, pending_image, is_tiled=True)
+        return pending_image
+
+    def encode(
+        self,
+        image_id: str,
+        load_image: ImageLoader,
+        features: torch.Tensor = None,
+        cache: bool = True,
+    ) -> Future:
+        # Background encodes pass cache=False so bulk uploads do not evict the
+        # embeddings annotators are working on
+        job = self.encoder_pool.submit(load_image, features, key=image_id)
+        if not cache:
+            return job
+
+        def on_encoded(future: Future) -> None:
+            if not future.cancelled() and future.exception() is None:
+                self.cache_image(image_id, future.result())
+
+        job.add_done_callback(on_encoded)
+        return job
+
+    def encode_batch(
+        self, load_images: Dict[str, ImageLoader], batch_size: int = 4
+    ) -> Dict[str, Future]:
+        # For background encodes, so the results are not cached
+        return self.encoder_pool.submit_batch(load_images, batch_size)
+
+    def set_image(
+        self,
+        session_id: str,
+        image_id: str,
+        load_image: ImageLoader,
+        features: torch.Tensor = None,
+        image_size: Tuple[int, int] = None,
+    ) -> Future:
+        encoded_image = self.get_cached_image(image_id)
+        if encoded_image is None and features is None:
+            # Reuse the embedding of another annotator working on the same image
+            encoded_image = self.get_shared_image(image_id)
+        elif encoded_image is None and image_size is not None and all(image_size):
+            # A stored embedding only needs the image size, not the pixels
+            input_size = ResizeLongestSide.get_preprocess_shape(
+                image_size[0], image_size[1], self.sam.image_encoder.img_size
+            )
+            encoded_image = (features, tuple(image_size), input_size)
+            self.cache_image(image_id, encoded_image)
+        if encoded_image is not None:
+            pending_image = Future()
+            pending_image.set_result(encoded_image)
+        else:
+            pending_image = self.encode(image_id, load_image, features)
+
+        session = self.get_session(session_id)
+        session.set_pending_image(image_id, pending_image)
+        return pending_image
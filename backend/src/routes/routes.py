@@ -25,6 +25,7 @@ def add_image():
     project_id = data["project_id"]
     file_name = data["file_name"]
     image = app.database.add_new_image(file_name, image_bytes, project_id)
+    app.precomputer.enqueue([image.image_id])
     imageInfo = {
         "image_id": image.image_id,
     }
@@ -46,6 +47,7 @@ def add_video():
     file_name = data["file_name"]
     fps = int(data["fps"])
     video = app.database.add_new_video(image_list, file_name, fps, project_id)
+    app.precomputer.enqueue([frame.image_id for frame in video.videoFrames])
     videoInfo = {
         "video_id": video.video_id,
     }
@@ -62,8 +64,8 @@ def add_video():
 @app.route("/api/get-image", methods=["GET"])
 def get_image():
     image_id = request.args.get("image_id")
-    image = app.database.get_image(image_id)
-    base64Image = base64.b64encode(image.image_bytes).decode("utf-8")
+    image_bytes = app.database.get_image_bytes(image_id)
+    base64Image = base64.b64encode(image_bytes).decode("utf-8")
     response = Response(
         data=base64Image, status=200, message="Image retrieved successfully"
     )
@@ -0,0 +1,106 @@
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from .logger import logger
+import queue
+import threading
+import time
+import torch
+
+
+@dataclass
+class DecodeRequest:
+    features: torch.Tensor
+    input_size: Tuple[int, int]
+    original_size: Tuple[int, int]
+    point_coords: Optional[torch.Tensor] = None
+    point_labels: Optional[torch.Tensor] = None
+    boxes: Optional[torch.Tensor] = None
+    mask_input: Optional[torch.Tensor] = None
+    # Prompts already embedded by the session, used instead of the prompt encoder
+    sparse_embeddings: Optional[torch.Tensor] = None
+    dense_embeddings: Optional[torch.Tensor] = None
+    multimask_output: bool = False
+    # Upscale masks only over their region, which starts at mask_offset
+    crop_masks: bool = False
+    mask_offset: Tuple[int, int] = (0, 0)
+    future: Future = field(default_factory=Future)
+
+    @property
+    def batch_key(self) -> tuple:
+        # Only prompts with the same layout can share a prompt encoder pass
+        num_points = None if self.point_coords is None else self.point_coords.shape[1]
+        return (
+            num_points,
+            self.boxes is not None,
+            self.mask_input is not None,
+            self.sparse_embeddings is not None,
+            self.multimask_output,
+        )
+
+
+class DecoderScheduler:
+    def __init__(self, decoder, batch_wait_ms: float = 5.0, max_batch_size: int = 32):
+        # Any decoder backend whose decode() resolves the futures of a batch
+        self.decoder = decoder
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.requests = queue.Queue()
+        self.running = True
+        self.worker = threading.Thread(
+            target=self._run, name="decoder-scheduler", daemon=True
+        )
+        self.worker.start()
+
+    def submit(self, request: DecodeRequest) -> Future:
+        if not self.running:
+            raise RuntimeError("Decoder scheduler has been shut down")
+        self.requests.put(request)
+        return request.future
+
+    def predict(
+        self, request: DecodeRequest
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        return self.submit(request).result()
+
+    def shutdown(self) -> None:
+        self.running = False
+        self.requests.put(None)
+        self.worker.join()
+
+    def _collect(self, first: DecodeRequest) -> List[DecodeRequest]:
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    request = self.requests.get(timeout=timeout)
+                else:
+                    request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self.running = False
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self) -> None:
+        while self.running:
+            first = self.requests.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.batch_key, []).append(request)
+            for requests in groups.values():
+                try:
+                    self.decoder.decode(requests)
+                except Exception as e:
+                    logger.exception("Batched mask decoding failed")
+                    for request in requests:
+                        if not request.future.done():
+                            request.future.set_exception(e)
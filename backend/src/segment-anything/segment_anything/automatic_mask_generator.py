@@ -14,22 +14,21 @@ from .modeling import Sam
 from .predictor import SamPredictor
 from .utils.amg import (
     MaskData,
-    area_from_rle,
     batch_iterator,
     batched_mask_to_box,
+    batched_mask_to_rle,
     box_xyxy_to_xywh,
     build_all_layer_point_grids,
     calculate_stability_score,
     coco_encode_rle,
     generate_crop_boxes,
     is_box_near_crop_edge,
-    mask_to_rle_pytorch,
     remove_small_regions,
-    rle_to_mask,
     uncrop_boxes_xyxy,
     uncrop_masks,
     uncrop_points,
 )
+from .utils.rle import batched_area_from_rle, batched_rle_to_mask, rle_to_json
 
 
 class SamAutomaticMaskGenerator:
@@ -49,6 +48,7 @@ class SamAutomaticMaskGenerator:
         point_grids: Optional[List[np.ndarray]] = None,
         min_mask_region_area: int = 0,
         output_mode: str = "binary_mask",
+        crop_batch_size: int = 4,
     ) -> None:
         """
         Using a SAM model, generates masks for the entire image.
@@ -93,6 +93,8 @@ class SamAutomaticMaskGenerator:
             'uncompressed_rle', or 'coco_rle'. 'coco_rle' requires pycocotools.
             For large resolutions, 'binary_mask' may consume large amounts of
             memory.
+          crop_batch_size (int): How many image crops the image encoder runs
+            at once. All crops of an image are encoded before any decoding.
         """
 
         assert (points_per_side is None) != (
@@ -132,6 +134,7 @@ class SamAutomaticMaskGenerator:
         self.crop_n_points_downscale_factor = crop_n_points_downscale_factor
         self.min_mask_region_area = min_mask_region_area
         self.output_mode = output_mode
+        self.crop_batch_size = crop_batch_size
 
     @torch.no_grad()
     def generate(self, image: np.ndarray) -> List[Dict[str, Any]]:
@@ -158,10 +161,44 @@ class SamAutomaticMaskGenerator:
                crop_box (list(float)): The crop of the image used to generate
                  the mask, given in XYWH format.
         """
+        return self.generate_batch([image])[0]
 
-        # Generate masks
-        mask_data = self._generate_masks(image)
+    @torch.no_grad()
+    def generate_batch(self, images: List[np.ndarray]) -> List[List[Dict[str, Any]]]:
+        """
+        Generates masks for several images. The crops of all images are
+        encoded together, in batches of crop_batch_size, before decoding.
+
+        Arguments:
+          images (list(np.ndarray)): The images to generate masks for, in HWC
+            uint8 format.
 
+        Returns:
+          list(list(dict(str, any))): Per image, the records described in
+            generate.
+        """
+        crops = [
+            generate_crop_boxes(
+                image.shape[:2], self.crop_n_layers, self.crop_overlap_ratio
+            )
+            for image in images
+        ]
+        cropped_ims = [
+            image[y0:y1, x0:x1, :]
+            for image, (crop_boxes, _) in zip(images, crops)
+            for x0, y0, x1, y1 in crop_boxes
+        ]
+        embeddings = self.predictor.encode_images(cropped_ims, self.crop_batch_size)
+
+        anns = []
+        for image, (crop_boxes, _) in zip(images, crops):
+            crop_embeddings = embeddings[: len(crop_boxes)]
+            embeddings = embeddings[len(crop_boxes) :]
+            mask_data = self._generate_masks(image, crop_embeddings)
+            anns.append(self._mask_data_to_anns(mask_data))
+        return anns
+
+    def _mask_data_to_anns(self, mask_data: MaskData) -> List[Dict[str, Any]]:
         # Filter small disconnected regions and holes in masks
         if self.min_mask_region_area > 0:
             mask_data = self.postprocess_small_regions(
@@ -173,19 +210,20 @@ class SamAutomaticMaskGenerator:
         # Encode masks
         if self.output_mode == "coco_rle":
             mask_data["segmentations"] = [
-                coco_encode_rle(rle) for rle in mask_data["rles"]
+                coco_encode_rle(rle_to_json(rle)) for rle in mask_data["rles"]
             ]
         elif self.output_mode == "binary_mask":
-            mask_data["segmentations"] = [rle_to_mask(rle) for rle in mask_data["rles"]]
+            mask_data["segmentations"] = list(batched_rle_to_mask(mask_data["rles"]))
         else:
-            mask_data["segmentations"] = mask_data["rles"]
+            mask_data["segmentations"] = [rle_to_json(rle) for rle in mask_data["rles"]]
 
         # Write mask records
+        areas = batched_area_from_rle(mask_data["rles"])
         curr_anns = []
         for idx in range(len(mask_data["segmentations"])):
             ann = {
                 "segmentation": mask_data["segmentations"][idx],
-                "area": area_from_rle(mask_data["rles"][idx]),
+                "area": int(areas[idx]),
                 "bbox": box_xyxy_to_xywh(mask_data["boxes"][idx]).tolist(),
                 "predicted_iou": mask_data["iou_preds"][idx].item(),
                 "point_coords": [mask_data["points"][idx].tolist()],
@@ -196,16 +234,29 @@ class SamAutomaticMaskGenerator:
 
         return curr_anns
 
-    def _generate_masks(self, image: np.ndarray) -> MaskData:
+    def _generate_masks(
+        self,
+        image: np.ndarray,
+        crop_embeddings: Optional[List[Dict[str, Any]]] = None,
+    ) -> MaskData:
         orig_size = image.shape[:2]
         crop_boxes, layer_idxs = generate_crop_boxes(
             orig_size, self.crop_n_layers, self.crop_overlap_ratio
         )
+        if crop_embeddings is None:
+            crop_embeddings = self.predictor.encode_images(
+                [image[y0:y1, x0:x1, :] for x0, y0, x1, y1 in crop_boxes],
+                self.crop_batch_size,
+            )
 
         # Iterate over image crops
         data = MaskData()
-        for crop_box, layer_idx in zip(crop_boxes, layer_idxs):
-            crop_data = self._process_crop(image, crop_box, layer_idx, orig_size)
+        for crop_box, layer_idx, crop_embedding in zip(
+            crop_boxes, layer_idxs, crop_embeddings
+        ):
+            crop_data = self._process_crop(
+                image, crop_box, layer_idx, orig_size, crop_embedding
+            )
             data.cat(crop_data)
 
         # Remove duplicate masks between crops
@@ -230,12 +281,20 @@ class SamAutomaticMaskGenerator:
         crop_box: List[int],
         crop_layer_idx: int,
         orig_size: Tuple[int, ...],
+        crop_embedding: Optional[Dict[str, Any]] = None,
     ) -> MaskData:
-        # Crop the image and calculate embeddings
+        # Crop the image and calculate embeddings, unless already encoded
         x0, y0, x1, y1 = crop_box
         cropped_im = image[y0:y1, x0:x1, :]
         cropped_im_size = cropped_im.shape[:2]
-        self.predictor.set_image(cropped_im)
+        if crop_embedding is None:
+            self.predictor.set_image(cropped_im)
+        else:
+            self.predictor.set_image_embedding(
+                crop_embedding["features"],
+                crop_embedding["original_size"],
+                crop_embedding["input_size"],
+            )
 
         # Get points for this crop
         points_scale = np.array(cropped_im_size)[None, ::-1]
@@ -325,7 +384,7 @@ class SamAutomaticMaskGenerator:
 
         # Compress to RLE
         data["masks"] = uncrop_masks(data["masks"], crop_box, orig_h, orig_w)
-        data["rles"] = mask_to_rle_pytorch(data["masks"])
+        data["rles"] = batched_mask_to_rle(data["masks"])
         del data["masks"]
 
         return data
@@ -348,9 +407,7 @@ class SamAutomaticMaskGenerator:
         # Filter small disconnected regions and holes
         new_masks = []
         scores = []
-        for rle in mask_data["rles"]:
-            mask = rle_to_mask(rle)
-
+        for mask in batched_rle_to_mask(mask_data["rles"]):
             mask, changed = remove_small_regions(mask, min_area, mode="holes")
             unchanged = not changed
             mask, changed = remove_small_regions(mask, min_area, mode="islands")
@@ -371,11 +428,12 @@ class SamAutomaticMaskGenerator:
             iou_threshold=nms_thresh,
         )
 
-        # Only recalculate RLEs for masks that have changed
-        for i_mask in keep_by_nms:
-            if scores[i_mask] == 0.0:
-                mask_torch = masks[i_mask].unsqueeze(0)
-                mask_data["rles"][i_mask] = mask_to_rle_pytorch(mask_torch)[0]
+        # Only recalculate RLEs for masks that have changed, in one batch
+        changed = [int(i) for i in keep_by_nms if scores[i] == 0.0]
+        if len(changed) > 0:
+            new_rles = batched_mask_to_rle(masks[changed])
+            for i_mask, rle in zip(changed, new_rles):
+                mask_data["rles"][i_mask] = rle
                 mask_data["boxes"][i_mask] = boxes[i_mask]  # update res directly
         mask_data.filter(keep_by_nms)
 
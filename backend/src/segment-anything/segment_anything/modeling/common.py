@@ -7,7 +7,7 @@
 import torch
 import torch.nn as nn
 
-from typing import Type
+from typing import Any, Callable, Dict, Sequence, Tuple, Type
 
 
 class MLPBlock(nn.Module):
@@ -41,3 +41,43 @@ class LayerNorm2d(nn.Module):
         x = (x - u) / torch.sqrt(s + self.eps)
         x = self.weight[:, None, None] * x + self.bias[:, None, None]
         return x
+
+
+def _is_compiling() -> bool:
+    # Compiled and traced graphs fold the tables themselves
+    if torch.jit.is_tracing():
+        return True
+    compiler = getattr(torch, "compiler", None)
+    return compiler is not None and getattr(compiler, "is_compiling", bool)()
+
+
+class FrozenTables:
+    """
+    Caches tensors that only depend on model weights and fixed shapes, so
+    they are not recomputed on every inference call. Disabled by default,
+    and bypassed while gradients are enabled, under torch.compile or while
+    tracing. A table is recomputed when one of the tensors it was derived
+    from is modified in place, moved or cast, e.g. by load_state_dict or an
+    optimizer step.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.tables: Dict[str, Tuple[tuple, Any]] = {}
+
+    def get(
+        self, name: str, sources: Sequence[torch.Tensor], compute: Callable[[], Any]
+    ) -> Any:
+        if not self.enabled or torch.is_grad_enabled() or _is_compiling():
+            return compute()
+        version = tuple((t._version, t.data_ptr(), t.dtype, t.device) for t in sources)
+        entry = self.tables.get(name)
+        if entry is None or entry[0] != version:
+            # Tables keep the precision of the weights, even under autocast
+            with torch.autocast(sources[0].device.type, enabled=False):
+                entry = (version, compute())
+            self.tables[name] = entry
+        return entry[1]
+
+    def clear(self) -> None:
+        self.tables.clear()
@@ -10,7 +10,7 @@ import torch.nn.functional as F
 
 from typing import Optional, Tuple, Type
 
-from .common import LayerNorm2d, MLPBlock
+from .common import FrozenTables, LayerNorm2d, MLPBlock
 
 
 # This class and its supporting functions below lightly adapted from the ViTDet backbone available at: https://github.com/facebookresearch/detectron2/blob/main/detectron2/modeling/backbone/vit.py # noqa
@@ -224,6 +224,11 @@ class Attention(nn.Module):
             # initialize relative positional embeddings
             self.rel_pos_h = nn.Parameter(torch.zeros(2 * input_size[0] - 1, head_dim))
             self.rel_pos_w = nn.Parameter(torch.zeros(2 * input_size[1] - 1, head_dim))
+        self.input_size = input_size
+        self.frozen_tables = FrozenTables()
+
+        # Fused attention avoids materializing the attention map and its softmax
+        self.use_sdpa = hasattr(F, "scaled_dot_product_attention")
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         B, H, W, _ = x.shape
@@ -234,17 +239,24 @@ class Attention(nn.Module):
         # q, k, v with shape (B * nHead, H * W, C)
         q, k, v = qkv.reshape(3, B * self.num_heads, H * W, -1).unbind(0)
 
-        attn = (q * self.scale) @ k.transpose(-2, -1)
-
         if self.use_rel_pos:
-            attn = add_decomposed_rel_pos(
-                attn, q, self.rel_pos_h, self.rel_pos_w, (H, W), (H, W)
-            )
+            Rh, Rw = self.get_rel_pos_tables((H, W), (H, W))
 
-        attn = attn.softmax(dim=-1)
+        if self.use_sdpa:
+            attn_bias = None
+            if self.use_rel_pos:
+                attn_bias = get_decomposed_rel_pos_bias(q, Rh, Rw, (H, W), (H, W))
+            # The default scale of head_dim**-0.5 matches self.scale
+            x = F.scaled_dot_product_attention(q, k, v, attn_mask=attn_bias)
+        else:
+            attn = (q * self.scale) @ k.transpose(-2, -1)
+
+            if self.use_rel_pos:
+                attn = attn + get_decomposed_rel_pos_bias(q, Rh, Rw, (H, W), (H, W))
+
+            x = attn.softmax(dim=-1) @ v
         x = (
-            (attn @ v)
-            .view(B, self.num_heads, H, W, -1)
+            x.view(B, self.num_heads, H, W, -1)
             .permute(0, 2, 3, 1, 4)
             .reshape(B, H, W, -1)
         )
@@ -252,6 +264,22 @@ class Attention(nn.Module):
 
         return x
 
+    def get_rel_pos_tables(
+        self, q_size: Tuple[int, int], k_size: Tuple[int, int]
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        return self.frozen_tables.get(
+            f"rel_pos_{q_size}_{k_size}",
+            (self.rel_pos_h, self.rel_pos_w),
+            lambda: (
+                get_rel_pos(q_size[0], k_size[0], self.rel_pos_h),
+                get_rel_pos(q_size[1], k_size[1], self.rel_pos_w),
+            ),
+        )
+
+    def precompute_tables(self) -> None:
+        if self.use_rel_pos:
+            self.get_rel_pos_tables(self.input_size, self.input_size)
+
 
 def window_partition(
     x: torch.Tensor, window_size: int
@@ -344,6 +372,60 @@ def get_rel_pos(q_size: int, k_size: int, rel_pos: torch.Tensor) -> torch.Tensor
     return rel_pos_resized[relative_coords.long()]
 
 
+def get_decomposed_rel_pos(
+    q: torch.Tensor,
+    Rh: torch.Tensor,
+    Rw: torch.Tensor,
+    q_size: Tuple[int, int],
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Calculate the height and width terms of decomposed Relative Positional
+    Embeddings from :paper:`mvitv2`.
+    Args:
+        q (Tensor): query q in the attention layer with shape (B, q_h * q_w, C).
+        Rh (Tensor): height embeddings (q_h, k_h, C) from get_rel_pos.
+        Rw (Tensor): width embeddings (q_w, k_w, C) from get_rel_pos.
+        q_size (Tuple): spatial sequence size of query q with (q_h, q_w).
+
+    Returns:
+        rel_h (Tensor): height terms with shape (B, q_h, q_w, k_h).
+        rel_w (Tensor): width terms with shape (B, q_h, q_w, k_w).
+    """
+    q_h, q_w = q_size
+    B, _, dim = q.shape
+    r_q = q.reshape(B, q_h, q_w, dim)
+    rel_h = torch.einsum("bhwc,hkc->bhwk", r_q, Rh)
+    rel_w = torch.einsum("bhwc,wkc->bhwk", r_q, Rw)
+    return rel_h, rel_w
+
+
+def get_decomposed_rel_pos_bias(
+    q: torch.Tensor,
+    Rh: torch.Tensor,
+    Rw: torch.Tensor,
+    q_size: Tuple[int, int],
+    k_size: Tuple[int, int],
+) -> torch.Tensor:
+    """
+    Calculate decomposed Relative Positional Embeddings as an additive bias
+    for the attention map, e.g. the attn_mask of scaled_dot_product_attention.
+    Args:
+        q (Tensor): query q in the attention layer with shape (B, q_h * q_w, C).
+        Rh (Tensor): height embeddings (q_h, k_h, C) from get_rel_pos.
+        Rw (Tensor): width embeddings (q_w, k_w, C) from get_rel_pos.
+        q_size (Tuple): spatial sequence size of query q with (q_h, q_w).
+        k_size (Tuple): spatial sequence size of key k with (k_h, k_w).
+
+    Returns:
+        bias (Tensor): attention bias with shape (B, q_h * q_w, k_h * k_w).
+    """
+    q_h, q_w = q_size
+    k_h, k_w = k_size
+    rel_h, rel_w = get_decomposed_rel_pos(q, Rh, Rw, q_size)
+    bias = rel_h[:, :, :, :, None] + rel_w[:, :, :, None, :]
+    return bias.reshape(q.shape[0], q_h * q_w, k_h * k_w)
+
+
 def add_decomposed_rel_pos(
     attn: torch.Tensor,
     q: torch.Tensor,
@@ -370,12 +452,9 @@ def add_decomposed_rel_pos(
     k_h, k_w = k_size
     Rh = get_rel_pos(q_h, k_h, rel_pos_h)
     Rw = get_rel_pos(q_w, k_w, rel_pos_w)
+    rel_h, rel_w = get_decomposed_rel_pos(q, Rh, Rw, q_size)
 
-    B, _, dim = q.shape
-    r_q = q.reshape(B, q_h, q_w, dim)
-    rel_h = torch.einsum("bhwc,hkc->bhwk", r_q, Rh)
-    rel_w = torch.einsum("bhwc,wkc->bhwk", r_q, Rw)
-
+    B = q.shape[0]
     attn = (
         attn.view(B, q_h, q_w, k_h, k_w)
         + rel_h[:, :, :, :, None]
@@ -10,7 +10,7 @@ from torch.nn import functional as F
 
 from typing import List, Tuple, Type
 
-from .common import LayerNorm2d
+from .common import FrozenTables, LayerNorm2d
 
 
 class MaskDecoder(nn.Module):
@@ -49,6 +49,7 @@ class MaskDecoder(nn.Module):
         self.iou_token = nn.Embedding(1, transformer_dim)
         self.num_mask_tokens = num_multimask_outputs + 1
         self.mask_tokens = nn.Embedding(self.num_mask_tokens, transformer_dim)
+        self.frozen_tables = FrozenTables()
 
         self.output_upscaling = nn.Sequential(
             nn.ConvTranspose2d(
@@ -84,7 +85,8 @@ class MaskDecoder(nn.Module):
         Predict masks given image and prompt embeddings.
 
         Arguments:
-          image_embeddings (torch.Tensor): the embeddings from the image encoder
+          image_embeddings (torch.Tensor): the embeddings from the image encoder,
+            either for a single image or one per prompt in the batch
           image_pe (torch.Tensor): positional encoding with the shape of image_embeddings
           sparse_prompt_embeddings (torch.Tensor): the embeddings of the points and boxes
           dense_prompt_embeddings (torch.Tensor): the embeddings of the mask inputs
@@ -113,6 +115,16 @@ class MaskDecoder(nn.Module):
         # Prepare output
         return masks, iou_pred
 
+    def precompute_tables(self) -> None:
+        self.get_output_tokens()
+
+    def get_output_tokens(self) -> torch.Tensor:
+        return self.frozen_tables.get(
+            "output_tokens",
+            (self.iou_token.weight, self.mask_tokens.weight),
+            lambda: torch.cat([self.iou_token.weight, self.mask_tokens.weight], dim=0),
+        )
+
     def predict_masks(
         self,
         image_embeddings: torch.Tensor,
@@ -122,16 +134,18 @@ class MaskDecoder(nn.Module):
     ) -> Tuple[torch.Tensor, torch.Tensor]:
         """Predicts masks. See 'forward' for more details."""
         # Concatenate output tokens
-        output_tokens = torch.cat(
-            [self.iou_token.weight, self.mask_tokens.weight], dim=0
-        )
+        output_tokens = self.get_output_tokens()
         output_tokens = output_tokens.unsqueeze(0).expand(
             sparse_prompt_embeddings.size(0), -1, -1
         )
         tokens = torch.cat((output_tokens, sparse_prompt_embeddings), dim=1)
 
-        # Expand per-image data in batch direction to be per-mask
-        src = torch.repeat_interleave(image_embeddings, tokens.shape[0], dim=0)
+        # Expand per-image data in batch direction to be per-mask. If one
+        # embedding per prompt is given, prompts are decoded against their own image.
+        if image_embeddings.shape[0] != tokens.shape[0]:
+            src = torch.repeat_interleave(image_embeddings, tokens.shape[0], dim=0)
+        else:
+            src = image_embeddings
         src = src + dense_prompt_embeddings
         pos_src = torch.repeat_interleave(image_pe, tokens.shape[0], dim=0)
         b, c, h, w = src.shape
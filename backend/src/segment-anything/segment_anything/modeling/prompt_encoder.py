@@ -10,7 +10,7 @@ from torch import nn
 
 from typing import Any, Optional, Tuple, Type
 
-from .common import LayerNorm2d
+from .common import FrozenTables, LayerNorm2d
 
 
 class PromptEncoder(nn.Module):
@@ -63,6 +63,7 @@ class PromptEncoder(nn.Module):
             nn.Conv2d(mask_in_chans, embed_dim, kernel_size=1),
         )
         self.no_mask_embed = nn.Embedding(1, embed_dim)
+        self.frozen_tables = FrozenTables()
 
     def get_dense_pe(self) -> torch.Tensor:
         """
@@ -73,7 +74,14 @@ class PromptEncoder(nn.Module):
           torch.Tensor: Positional encoding with shape
             1x(embed_dim)x(embedding_h)x(embedding_w)
         """
-        return self.pe_layer(self.image_embedding_size).unsqueeze(0)
+        return self.frozen_tables.get(
+            "dense_pe",
+            (self.pe_layer.positional_encoding_gaussian_matrix,),
+            lambda: self.pe_layer(self.image_embedding_size).unsqueeze(0),
+        )
+
+    def precompute_tables(self) -> None:
+        self.get_dense_pe()
 
     def _embed_points(
         self,
@@ -113,6 +121,56 @@ class PromptEncoder(nn.Module):
         mask_embedding = self.mask_downscaling(masks)
         return mask_embedding
 
+    def embed_points(self, points: torch.Tensor, labels: torch.Tensor) -> torch.Tensor:
+        """
+        Embeds point prompts without the padding point 'forward' appends when
+        there is no box. Each point is embedded independently of the others.
+        """
+        return self._embed_points(points, labels, pad=False)
+
+    def embed_boxes(self, boxes: torch.Tensor) -> torch.Tensor:
+        """Embeds box prompts."""
+        return self._embed_boxes(boxes)
+
+    def embed_masks(self, masks: torch.Tensor) -> torch.Tensor:
+        """Embeds mask inputs."""
+        return self._embed_masks(masks)
+
+    def combine_embeddings(
+        self,
+        point_embeddings: Optional[torch.Tensor],
+        box_embeddings: Optional[torch.Tensor],
+        mask_embeddings: Optional[torch.Tensor],
+        batch_size: int = 1,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Combines embeddings from 'embed_points', 'embed_boxes' and
+        'embed_masks' into the sparse and dense embeddings 'forward' returns
+        for the same prompts, so that they can be computed separately.
+        """
+        sparse_embeddings = torch.empty(
+            (batch_size, 0, self.embed_dim), device=self._get_device()
+        )
+        if point_embeddings is not None:
+            sparse_embeddings = torch.cat([sparse_embeddings, point_embeddings], dim=1)
+            if box_embeddings is None:
+                # The padding point always embeds to not_a_point_embed
+                padding = self.not_a_point_embed.weight.expand(batch_size, 1, -1)
+                sparse_embeddings = torch.cat([sparse_embeddings, padding], dim=1)
+        if box_embeddings is not None:
+            sparse_embeddings = torch.cat([sparse_embeddings, box_embeddings], dim=1)
+
+        if mask_embeddings is not None:
+            dense_embeddings = mask_embeddings
+        else:
+            dense_embeddings = self.no_mask_embed.weight.reshape(1, -1, 1, 1).expand(
+                batch_size,
+                -1,
+                self.image_embedding_size[0],
+                self.image_embedding_size[1],
+            )
+        return sparse_embeddings, dense_embeddings
+
     def _get_batch_size(
         self,
         points: Optional[Tuple[torch.Tensor, torch.Tensor]],
@@ -8,8 +8,10 @@ import torch
 from torch import nn
 from torch.nn import functional as F
 
-from typing import Any, Dict, List, Tuple
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 
+from .common import FrozenTables
 from .image_encoder import ImageEncoderViT
 from .mask_decoder import MaskDecoder
 from .prompt_encoder import PromptEncoder
@@ -52,6 +54,25 @@ class Sam(nn.Module):
     def device(self) -> Any:
         return self.pixel_mean.device
 
+    @torch.no_grad()
+    def set_frozen_inference(self, enabled: bool = True) -> None:
+        """
+        Enables caching of tensors that only depend on the weights and the
+        fixed input size, such as relative position tables and the dense
+        positional encoding, and precomputes them. Cached tables are used for
+        calls without gradients and are recomputed if the weights change.
+
+        Arguments:
+          enabled (bool): Whether to cache the tables.
+        """
+        for module in self.modules():
+            frozen_tables = getattr(module, "frozen_tables", None)
+            if isinstance(frozen_tables, FrozenTables):
+                frozen_tables.enabled = enabled
+                frozen_tables.clear()
+                if enabled:
+                    module.precompute_tables()
+
     @torch.no_grad()
     def forward(
         self,
@@ -167,6 +188,73 @@ class Sam(nn.Module):
         )
         return masks
 
+    def postprocess_masks_roi(
+        self,
+        masks: torch.Tensor,
+        input_size: Tuple[int, ...],
+        original_size: Tuple[int, ...],
+        threshold: Optional[float] = None,
+        padding: int = 1,
+    ) -> Tuple[torch.Tensor, Tuple[int, int]]:
+        """
+        Upscale masks like postprocess_masks, but only over the region of
+        the original image where they can exceed the threshold.
+
+        Both bilinear resizes in postprocess_masks are separable and their
+        weights are non-negative, so they compose into one weight matrix
+        per axis. An output pixel can only exceed the threshold if one of
+        the low resolution logits it is interpolated from does, which
+        bounds the region exactly before any upscaling happens.
+
+        Arguments:
+          masks (torch.Tensor): Batched masks from the mask_decoder,
+            in BxCxHxW format.
+          input_size (tuple(int, int)): The size of the image input to the
+            model, in (H, W) format. Used to remove padding.
+          original_size (tuple(int, int)): The original size of the image
+            before resizing for input to the model, in (H, W) format.
+          threshold (float or None): The logit threshold that bounds the
+            region. Defaults to mask_threshold.
+          padding (int): Pixels of margin kept around the region, within
+            the image.
+
+        Returns:
+          (torch.Tensor): Batched masks in BxCxhxw format, covering the
+            region of every mask in the batch.
+          (tuple(int, int)): The (top, left) offset of the region in the
+            original image.
+        """
+        if threshold is None:
+            threshold = self.mask_threshold
+        img_size = self.image_encoder.img_size
+        active = (masks > threshold).flatten(0, 1).any(dim=0)
+        crops = []
+        for axis, dim in enumerate((-2, -1)):
+            index, weights = _upscale_weights(
+                masks.shape[dim], img_size, input_size[axis], original_size[axis]
+            )
+            index, weights = index.to(masks.device), weights.to(masks.device)
+            active_axis = active.any(dim=1 - axis)
+            reached = (active_axis[index] & (weights > 0)).any(dim=1)
+            rows = torch.nonzero(reached).flatten()
+            start, end = 0, 0
+            if len(rows) > 0:
+                start = max(int(rows[0]) - padding, 0)
+                end = min(int(rows[-1]) + 1 + padding, original_size[axis])
+            crops.append((start, end, index[start:end], weights[start:end]))
+
+        top, bottom, row_index, row_weights = crops[0]
+        left, right, col_index, col_weights = crops[1]
+        if 2 * (bottom - top) * (right - left) > original_size[0] * original_size[1]:
+            # Large regions are faster with the dense resize
+            masks = self.postprocess_masks(masks, input_size, original_size)
+            return masks[..., top:bottom, left:right], (top, left)
+
+        # Columns first, while there are still only low resolution rows
+        masks = _resize_axis(masks.float(), col_index, col_weights, dim=-1)
+        masks = _resize_axis(masks, row_index, row_weights, dim=-2)
+        return masks, (top, left)
+
     def preprocess(self, x: torch.Tensor) -> torch.Tensor:
         """Normalize pixel values and pad to a square input."""
         # Normalize colors
@@ -178,3 +266,35 @@ class Sam(nn.Module):
         padw = self.image_encoder.img_size - w
         x = F.pad(x, (0, padw, 0, padh))
         return x
+
+
+@lru_cache(maxsize=16)
+def _upscale_weights(
+    low_res_size: int, img_size: int, input_size: int, original_size: int
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    # Resizing an identity matrix gives the interpolation weights per output pixel
+    weights = torch.eye(low_res_size)[None]
+    weights = F.interpolate(weights, img_size, mode="linear", align_corners=False)
+    weights = weights[..., :input_size]
+    weights = F.interpolate(weights, original_size, mode="linear", align_corners=False)
+    weights = weights[0].T
+
+    # Each output pixel reads a few neighbouring inputs, so keep only that band
+    nonzero = weights > 0
+    first = nonzero.float().argmax(dim=1)
+    width = int(nonzero.sum(dim=1).max())
+    index = first[:, None] + torch.arange(width)
+    in_range = index < low_res_size
+    index = index.clamp(max=low_res_size - 1)
+    return index, weights.gather(1, index) * in_range
+
+
+def _resize_axis(
+    x: torch.Tensor, index: torch.Tensor, weights: torch.Tensor, dim: int
+) -> torch.Tensor:
+    shape = [1] * x.dim()
+    shape[dim] = -1
+    out = x.index_select(dim, index[:, 0]) * weights[:, 0].view(shape)
+    for k in range(1, index.shape[1]):
+        out += x.index_select(dim, index[:, k]) * weights[:, k].view(shape)
+    return out
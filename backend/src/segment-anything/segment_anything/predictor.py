@@ -9,7 +9,7 @@ import torch
 
 from segment_anything.modeling import Sam
 
-from typing import Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from .utils.transforms import ResizeLongestSide
 
@@ -18,6 +18,7 @@ class SamPredictor:
     def __init__(
         self,
         sam_model: Sam,
+        image_encoder: Optional[Callable[[torch.Tensor], torch.Tensor]] = None,
     ) -> None:
         """
         Uses SAM to calculate the image embedding for an image, and then
@@ -25,9 +26,13 @@ class SamPredictor:
 
         Arguments:
           sam_model (Sam): The model to use for mask prediction.
+          image_encoder (callable or None): Maps preprocessed 1x3xHxW images
+            to image embeddings in place of the model's image encoder, e.g.
+            an exported graph run with onnxruntime.
         """
         super().__init__()
         self.model = sam_model
+        self.image_encoder = image_encoder or sam_model.image_encoder
         self.transform = ResizeLongestSide(sam_model.image_encoder.img_size)
         self.reset_image()
 
@@ -36,6 +41,7 @@ class SamPredictor:
         image: np.ndarray,
         image_format: str = "RGB",
         features: torch.Tensor = None,
+        original_size: Optional[Tuple[int, ...]] = None,
     ) -> None:
         """
         Calculates the image embeddings for the provided image, allowing
@@ -45,22 +51,25 @@ class SamPredictor:
           image (np.ndarray): The image for calculating masks. Expects an
             image in HWC uint8 format, with pixel values in [0, 255].
           image_format (str): The color format of the image, in ['RGB', 'BGR'].
+          original_size (tuple(int, int) or None): The (H, W) size of the
+            full image, if image was decoded at a reduced size. Prompts and
+            masks then stay in full size coordinates.
         """
         assert image_format in [
             "RGB",
             "BGR",
         ], f"image_format must be in ['RGB', 'BGR'], is {image_format}."
-        if image_format != self.model.image_format:
-            image = image[..., ::-1]
-
         # Transform the image to the form expected by the model
-        input_image = self.transform.apply_image(image)
-        input_image_torch = torch.as_tensor(input_image, device=self.device)
-        input_image_torch = input_image_torch.permute(2, 0, 1).contiguous()[
-            None, :, :, :
-        ]
+        if original_size is None:
+            original_size = image.shape[:2]
+        input_image_torch = self.transform.apply_image_to_tensor(
+            image, original_size, self.device
+        )
+        if image_format != self.model.image_format:
+            # Channels resize independently, so they can be swapped afterwards
+            input_image_torch = input_image_torch.flip(1)
 
-        return self.set_torch_image(input_image_torch, image.shape[:2], features)
+        return self.set_torch_image(input_image_torch, original_size, features)
 
     @torch.no_grad()
     def set_torch_image(
@@ -93,10 +102,91 @@ class SamPredictor:
             self.features = features
         else:
             input_image = self.model.preprocess(transformed_image)
-            self.features = self.model.image_encoder(input_image)
+            self.features = self.image_encoder(input_image)
         self.is_image_set = True
         return self.features
 
+    def set_image_embedding(
+        self,
+        features: torch.Tensor,
+        original_image_size: Tuple[int, ...],
+        input_size: Tuple[int, ...],
+    ) -> None:
+        """
+        Sets a previously calculated image embedding, allowing masks to be
+        predicted without running the image encoder or transforming the image.
+
+        Arguments:
+          features (torch.Tensor): The image embedding, with shape 1xCxHxW.
+          original_image_size (tuple(int, int)): The size of the image
+            before transformation, in (H, W) format.
+          input_size (tuple(int, int)): The size of the image after
+            transformation with ResizeLongestSide, in (H, W) format.
+        """
+        self.reset_image()
+        self.original_size = tuple(original_image_size)
+        self.input_size = tuple(input_size)
+        self.features = features.to(self.device)
+        self.is_image_set = True
+
+    @torch.no_grad()
+    def encode_images(
+        self,
+        images: List[np.ndarray],
+        batch_size: int = 4,
+        image_format: str = "RGB",
+        original_sizes: Optional[List[Optional[Tuple[int, ...]]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Calculates image embeddings for several images, running the image
+        encoder on batches of them. Does not change the image currently set;
+        a result can be activated later with set_image_embedding.
+
+        Arguments:
+          images (list(np.ndarray)): Images in HWC uint8 format, with pixel
+            values in [0, 255].
+          batch_size (int): How many images the image encoder runs at once.
+          image_format (str): The color format of the images, in ['RGB', 'BGR'].
+          original_sizes (list(tuple(int, int) or None) or None): The full
+            (H, W) size of each image decoded at a reduced size, see set_image.
+
+        Returns:
+          (list(dict(str, any))): Per image, a dict with the 1xCxHxW image
+            embedding under 'features', and the 'original_size' and
+            'input_size' of the image in (H, W) format.
+        """
+        assert image_format in [
+            "RGB",
+            "BGR",
+        ], f"image_format must be in ['RGB', 'BGR'], is {image_format}."
+        if original_sizes is None:
+            original_sizes = [None] * len(images)
+        original_sizes = [
+            tuple(size or image.shape[:2])
+            for image, size in zip(images, original_sizes)
+        ]
+        input_images = self.transform.apply_images_to_tensors(
+            images, original_sizes, self.device
+        )
+        if image_format != self.model.image_format:
+            input_images = [x.flip(1) for x in input_images]
+
+        encoded = []
+        for start in range(0, len(images), batch_size):
+            batch = input_images[start : start + batch_size]
+            # preprocess pads every image to the same square input
+            input_batch = torch.cat([self.model.preprocess(x) for x in batch])
+            features = self.image_encoder(input_batch)
+            for i, x in enumerate(batch):
+                encoded.append(
+                    {
+                        "features": features[i : i + 1],
+                        "original_size": original_sizes[start + i],
+                        "input_size": tuple(x.shape[-2:]),
+                    }
+                )
+        return encoded
+
     def predict(
         self,
         point_coords: Optional[np.ndarray] = None,
@@ -143,7 +233,46 @@ class SamPredictor:
                 "An image must be set with .set_image(...) before mask prediction."
             )
 
-        # Transform input prompts
+        coords_torch, labels_torch, box_torch, mask_input_torch = self.prepare_prompts(
+            point_coords, point_labels, box, mask_input
+        )
+
+        masks, iou_predictions, low_res_masks = self.predict_torch(
+            coords_torch,
+            labels_torch,
+            box_torch,
+            mask_input_torch,
+            multimask_output,
+            return_logits=return_logits,
+        )
+
+        masks_np = masks[0].detach().cpu().numpy()
+        iou_predictions_np = iou_predictions[0].detach().cpu().numpy()
+        low_res_masks_np = low_res_masks[0].detach().cpu().numpy()
+        return masks_np, iou_predictions_np, low_res_masks_np
+
+    def prepare_prompts(
+        self,
+        point_coords: Optional[np.ndarray] = None,
+        point_labels: Optional[np.ndarray] = None,
+        box: Optional[np.ndarray] = None,
+        mask_input: Optional[np.ndarray] = None,
+    ) -> Tuple[
+        Optional[torch.Tensor],
+        Optional[torch.Tensor],
+        Optional[torch.Tensor],
+        Optional[torch.Tensor],
+    ]:
+        """
+        Transforms numpy prompts in the original image frame, as accepted by
+        'predict', into the batched torch tensors expected by 'predict_torch'.
+        Requires an image to be set, since the original image size is needed.
+
+        Returns:
+          (tuple(torch.Tensor or None)): The point coordinates (1xNx2), point
+            labels (1xN), box (1x4) and mask input (1x1xHxW), each None if the
+            corresponding prompt was not given.
+        """
         coords_torch, labels_torch, box_torch, mask_input_torch = None, None, None, None
         if point_coords is not None:
             assert (
@@ -166,20 +295,7 @@ class SamPredictor:
                 mask_input, dtype=torch.float, device=self.device
             )
             mask_input_torch = mask_input_torch[None, :, :, :]
-
-        masks, iou_predictions, low_res_masks = self.predict_torch(
-            coords_torch,
-            labels_torch,
-            box_torch,
-            mask_input_torch,
-            multimask_output,
-            return_logits=return_logits,
-        )
-
-        masks_np = masks[0].detach().cpu().numpy()
-        iou_predictions_np = iou_predictions[0].detach().cpu().numpy()
-        low_res_masks_np = low_res_masks[0].detach().cpu().numpy()
-        return masks_np, iou_predictions_np, low_res_masks_np
+        return coords_torch, labels_torch, box_torch, mask_input_torch
 
     @torch.no_grad()
     def predict_torch(
@@ -0,0 +1,298 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+import torch
+
+from segment_anything.modeling import Sam
+
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .predictor import SamPredictor
+
+
+class TiledSamPredictor:
+    def __init__(
+        self,
+        sam_model: Sam,
+        tile_size: int = 1024,
+        overlap: int = 256,
+        max_cached_tiles: int = 16,
+        image_encoder: Optional[Callable[[torch.Tensor], torch.Tensor]] = None,
+        tile_encoder: Optional[
+            Callable[[Tuple[int, int], np.ndarray], Tuple[torch.Tensor, ...]]
+        ] = None,
+    ) -> None:
+        """
+        Predicts masks on images too large to encode at once. The image is
+        split into overlapping tiles that are only encoded once a prompt
+        reaches them, so encoding cost follows the annotated area rather
+        than the image size.
+
+        Arguments:
+          sam_model (Sam): The model to use for mask prediction.
+          tile_size (int): The side length of a tile in image pixels. Tiles
+            no larger than the model input size keep full resolution.
+          overlap (int): The overlap between neighbouring tiles in pixels.
+            Prompts spanning less than this always fit within one tile.
+          max_cached_tiles (int): How many tile embeddings to keep, least
+            recently used tiles are dropped first.
+          image_encoder (callable or None): Passed on to SamPredictor.
+          tile_encoder (callable or None): Takes a tile's (top, left) start
+            and its pixels, and returns the (features, original_size,
+            input_size) of the encoded tile, e.g. from a worker pool. Tiles
+            are encoded in place with set_image if not given.
+        """
+        assert 0 <= overlap < tile_size, "overlap must be smaller than tile_size."
+        self.predictor = SamPredictor(sam_model, image_encoder)
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.max_cached_tiles = max_cached_tiles
+        self.tile_encoder = tile_encoder
+        self.tile_embeddings: Dict[Tuple[int, int], tuple] = OrderedDict()
+        self.reset_image()
+
+    def set_image(
+        self,
+        image: np.ndarray,
+        image_format: str = "RGB",
+        tile_embeddings: Optional[Dict[Tuple[int, int], tuple]] = None,
+    ) -> None:
+        """
+        Sets the image to predict masks on, without encoding any of it.
+
+        Arguments:
+          image (np.ndarray): The image in HWC uint8 format, with pixel
+            values in [0, 255].
+          image_format (str): The color format of the image, in ['RGB', 'BGR'].
+          tile_embeddings (OrderedDict or None): Tile embeddings of this image
+            to start from and add to, e.g. shared by predictors working on
+            the same image with the same tiling.
+        """
+        self.reset_image()
+        if tile_embeddings is not None:
+            self.tile_embeddings = tile_embeddings
+        self.image = image
+        self.image_format = image_format
+        self.original_size = image.shape[:2]
+        self.tiles = [
+            (top, left)
+            for top in self._tile_starts(self.original_size[0])
+            for left in self._tile_starts(self.original_size[1])
+        ]
+
+    def _tile_starts(self, size: int) -> List[int]:
+        if size <= self.tile_size:
+            return [0]
+        stride = self.tile_size - self.overlap
+        return list(range(0, size - self.tile_size, stride)) + [size - self.tile_size]
+
+    def tile_bounds(self, tile: Tuple[int, int]) -> Tuple[int, int, int, int]:
+        """Returns the (top, left, bottom, right) pixel bounds of a tile."""
+        top, left = tile
+        bottom = min(top + self.tile_size, self.original_size[0])
+        right = min(left + self.tile_size, self.original_size[1])
+        return top, left, bottom, right
+
+    def _set_tile(self, tile: Tuple[int, int]) -> None:
+        # Popping and reinserting keeps a cache shared between threads consistent
+        embedding = self.tile_embeddings.pop(tile, None)
+        if embedding is not None:
+            self.tile_embeddings[tile] = embedding
+            self.predictor.set_image_embedding(*embedding)
+            return
+        top, left, bottom, right = self.tile_bounds(tile)
+        tile_image = self.image[top:bottom, left:right]
+        if self.tile_encoder is not None:
+            embedding = self.tile_encoder(tile, tile_image)
+            self.predictor.set_image_embedding(*embedding)
+        else:
+            self.predictor.set_image(tile_image, image_format=self.image_format)
+            embedding = (
+                self.predictor.features,
+                self.predictor.original_size,
+                self.predictor.input_size,
+            )
+        self.tile_embeddings[tile] = embedding
+        while len(self.tile_embeddings) > self.max_cached_tiles:
+            self.tile_embeddings.popitem(last=False)
+
+    def select_tiles(
+        self,
+        point_coords: Optional[np.ndarray],
+        point_labels: Optional[np.ndarray],
+        box: Optional[np.ndarray],
+    ) -> List[Tuple[int, int]]:
+        """
+        Picks the tile whose center is closest to the prompts among those
+        containing all of them, or else every tile that holds a positive
+        point or part of the box.
+        """
+        corners = []
+        if point_coords is not None:
+            corners.append(point_coords.reshape(-1, 2))
+        if box is not None:
+            corners.append(box.reshape(-1, 2))
+        corners = np.concatenate(corners)
+        x0, y0 = corners.min(axis=0)
+        x1, y1 = corners.max(axis=0)
+
+        containing = []
+        for tile in self.tiles:
+            top, left, bottom, right = self.tile_bounds(tile)
+            if left <= x0 and x1 < right and top <= y0 and y1 < bottom:
+                center = ((left + right) / 2, (top + bottom) / 2)
+                distance = abs(center[0] - (x0 + x1) / 2) + abs(
+                    center[1] - (y0 + y1) / 2
+                )
+                containing.append((distance, tile))
+        if len(containing) > 0:
+            return [min(containing)[1]]
+
+        tiles = []
+        for tile in self.tiles:
+            top, left, bottom, right = self.tile_bounds(tile)
+            if box is not None:
+                if (
+                    box[0] < right
+                    and box[2] > left
+                    and box[1] < bottom
+                    and box[3] > top
+                ):
+                    tiles.append(tile)
+                    continue
+            if point_coords is not None:
+                inside = (
+                    (point_coords[:, 0] >= left)
+                    & (point_coords[:, 0] < right)
+                    & (point_coords[:, 1] >= top)
+                    & (point_coords[:, 1] < bottom)
+                )
+                if (point_labels[inside] == 1).any():
+                    tiles.append(tile)
+        return tiles
+
+    def predict(
+        self,
+        point_coords: Optional[np.ndarray] = None,
+        point_labels: Optional[np.ndarray] = None,
+        box: Optional[np.ndarray] = None,
+        mask_inputs: Optional[Dict[Tuple[int, int], np.ndarray]] = None,
+        multimask_output: bool = True,
+        return_logits: bool = False,
+    ) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int]]:
+        """
+        Predict masks for the given prompts, in image coordinates. Prompts
+        spread over several tiles are decoded per tile, each tile getting
+        the points inside it and the part of the box it overlaps, and the
+        tile logits are merged by taking their maximum.
+
+        Arguments:
+          point_coords (np.ndarray or None): A Nx2 array of point prompts to
+            the model. Each point is in (X,Y) in pixels.
+          point_labels (np.ndarray or None): A length N array of labels for the
+            point prompts. 1 indicates a foreground point and 0 indicates a
+            background point.
+          box (np.ndarray or None): A length 4 array given a box prompt to the
+            model, in XYXY format.
+          mask_inputs (dict or None): Low resolution 1xHxW logits per tile,
+            typically low_res_logits from a previous prediction. Tiles
+            without one are decoded without a mask input.
+          multimask_output (bool): If true, the model will return three masks.
+          return_logits (bool): If true, returns un-thresholded masks logits
+            instead of a binary mask.
+
+        Returns:
+          (np.ndarray): The output masks in CxHxW format, covering the
+            union of the selected tiles.
+          (np.ndarray): An array of length C containing the model's
+            predictions for the quality of each mask, averaged over tiles.
+          (tuple(int, int)): The (top, left) offset of the masks in the image.
+
+        The low resolution logits of the best mask of each decoded tile are
+        kept in low_res_logits, ready to be passed back as mask_inputs.
+        """
+        if self.image is None:
+            raise RuntimeError(
+                "An image must be set with .set_image(...) before mask prediction."
+            )
+        assert (
+            point_coords is not None or box is not None
+        ), "At least one point or a box is required."
+        if point_coords is not None:
+            point_coords = np.asarray(point_coords, dtype=np.float32).reshape(-1, 2)
+            point_labels = np.asarray(point_labels).reshape(-1)
+        if box is not None:
+            box = np.asarray(box, dtype=np.float32).reshape(4)
+
+        tiles = self.select_tiles(point_coords, point_labels, box)
+        assert len(tiles) > 0, "Prompts spanning several tiles need a positive point."
+        bounds = np.array([self.tile_bounds(tile) for tile in tiles])
+        top, left = bounds[:, :2].min(axis=0)
+        bottom, right = bounds[:, 2:].max(axis=0)
+
+        logits, scores = None, []
+        self.low_res_logits = {}
+        for tile in tiles:
+            tile_top, tile_left, tile_bottom, tile_right = self.tile_bounds(tile)
+            origin = np.array([tile_left, tile_top], dtype=np.float32)
+            tile_coords, tile_labels, tile_box = None, None, None
+            if point_coords is not None:
+                size = np.array([tile_right, tile_bottom], dtype=np.float32)
+                inside = ((point_coords >= origin) & (point_coords < size)).all(axis=1)
+                if inside.any():
+                    tile_coords = point_coords[inside] - origin
+                    tile_labels = point_labels[inside]
+            if box is not None:
+                corner = np.minimum(box[2:], [tile_right, tile_bottom])
+                if (corner > np.maximum(box[:2], origin)).all():
+                    tile_box = np.concatenate(
+                        [np.maximum(box[:2], origin) - origin, corner - origin]
+                    )
+
+            mask_input = None
+            if mask_inputs is not None:
+                mask_input = mask_inputs.get(tile)
+
+            self._set_tile(tile)
+            tile_logits, tile_scores, low_res_logits = self.predictor.predict(
+                tile_coords,
+                tile_labels,
+                tile_box,
+                mask_input=mask_input,
+                multimask_output=multimask_output,
+                return_logits=True,
+            )
+            best = np.argmax(tile_scores)
+            self.low_res_logits[tile] = low_res_logits[best : best + 1]
+            if logits is None:
+                logits = np.full(
+                    (len(tile_logits), bottom - top, right - left),
+                    -np.inf,
+                    dtype=np.float32,
+                )
+            region = logits[
+                :,
+                tile_top - top : tile_bottom - top,
+                tile_left - left : tile_right - left,
+            ]
+            np.maximum(region, tile_logits, out=region)
+            scores.append(tile_scores)
+
+        masks = logits
+        if not return_logits:
+            masks = logits > self.predictor.model.mask_threshold
+        return masks, np.mean(scores, axis=0), (int(top), int(left))
+
+    def reset_image(self) -> None:
+        """Drops the image and the embeddings of its tiles."""
+        self.image = None
+        self.image_format = "RGB"
+        self.original_size = None
+        self.tiles = []
+        self.tile_embeddings = OrderedDict()
+        self.low_res_logits: Dict[Tuple[int, int], np.ndarray] = {}
@@ -12,6 +12,8 @@ from copy import deepcopy
 from itertools import product
 from typing import Any, Dict, Generator, ItemsView, List, Tuple
 
+from .rle import batched_area_from_rle, batched_rle_to_mask, rle_to_json
+
 
 class MaskData:
     """
@@ -109,48 +111,59 @@ def mask_to_rle_pytorch(tensor: torch.Tensor) -> List[Dict[str, Any]]:
     Encodes masks to an uncompressed RLE, in the format expected by
     pycoco tools.
     """
+    return [rle_to_json(rle) for rle in batched_mask_to_rle(tensor)]
+
+
+def batched_mask_to_rle(tensor: torch.Tensor) -> List[Dict[str, Any]]:
+    """
+    Encodes masks to uncompressed RLEs with counts as int32 numpy arrays,
+    which the batched helpers in utils.rle consume without conversion.
+    """
     # Put in fortran order and flatten h,w
     b, h, w = tensor.shape
+    if b == 0:
+        return []
     tensor = tensor.permute(0, 2, 1).flatten(1)
 
     # Compute change indices
     diff = tensor[:, 1:] ^ tensor[:, :-1]
     change_indices = diff.nonzero()
 
-    # Encode run length
-    out = []
-    for i in range(b):
-        cur_idxs = change_indices[change_indices[:, 0] == i, 1]
-        cur_idxs = torch.cat(
-            [
-                torch.tensor([0], dtype=cur_idxs.dtype, device=cur_idxs.device),
-                cur_idxs + 1,
-                torch.tensor([h * w], dtype=cur_idxs.dtype, device=cur_idxs.device),
-            ]
-        )
-        btw_idxs = cur_idxs[1:] - cur_idxs[:-1]
-        counts = [] if tensor[i, 0] == 0 else [0]
-        counts.extend(btw_idxs.detach().cpu().tolist())
-        out.append({"size": [h, w], "counts": counts})
-    return out
+    # Changes come out of nonzero grouped by mask and in order, so runs
+    # between consecutive changes of all masks are computed at once
+    num_changes = torch.bincount(change_indices[:, 0], minlength=b)
+    ends = change_indices[:, 1] + 1
+    starts = ends.roll(1)
+    last = torch.cumsum(num_changes, dim=0) - 1
+    has_changes = num_changes > 0
+    starts[last[has_changes] - num_changes[has_changes] + 1] = 0
+    last_ends = ends.new_zeros(b)
+    last_ends[has_changes] = ends[last[has_changes]]
+
+    # Lay out every mask's counts back to back: a zero if the mask starts
+    # with foreground, the runs between changes, then the final run
+    leading = tensor[:, 0].long()
+    sizes = leading + num_changes + 1
+    offsets = torch.cumsum(sizes, dim=0) - sizes
+    counts = ends.new_zeros(int(sizes.sum()))
+    change_offsets = torch.repeat_interleave(offsets + leading, num_changes)
+    first_changes = torch.repeat_interleave(last - num_changes + 1, num_changes)
+    positions = torch.arange(len(ends), device=ends.device) - first_changes
+    counts[change_offsets + positions] = ends - starts
+    counts[offsets + sizes - 1] = h * w - last_ends
+
+    counts = counts.detach().cpu().numpy().astype(np.int32)
+    split_counts = np.split(counts, np.cumsum(sizes.detach().cpu().numpy())[:-1])
+    return [{"size": [h, w], "counts": c} for c in split_counts]
 
 
 def rle_to_mask(rle: Dict[str, Any]) -> np.ndarray:
     """Compute a binary mask from an uncompressed RLE."""
-    h, w = rle["size"]
-    mask = np.empty(h * w, dtype=bool)
-    idx = 0
-    parity = False
-    for count in rle["counts"]:
-        mask[idx : idx + count] = parity
-        idx += count
-        parity ^= True
-    mask = mask.reshape(w, h)
-    return mask.transpose()  # Put in C order
+    return batched_rle_to_mask([rle])[0]
 
 
 def area_from_rle(rle: Dict[str, Any]) -> int:
-    return sum(rle["counts"][1::2])
+    return int(batched_area_from_rle([rle])[0])
 
 
 def calculate_stability_score(
@@ -0,0 +1,107 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+
+from typing import Any, Dict, List, Tuple
+
+
+def rle_counts(rle: Dict[str, Any]) -> np.ndarray:
+    """Returns the counts of an uncompressed RLE as an int32 array."""
+    return np.asarray(rle["counts"], dtype=np.int32)
+
+
+def rle_to_json(rle: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns an uncompressed RLE with its counts as a list of ints."""
+    return {"size": list(rle["size"]), "counts": rle_counts(rle).tolist()}
+
+
+def _concat_counts(rles: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    # All counts back to back, and the index of the RLE each count belongs to
+    counts = [rle_counts(rle) for rle in rles]
+    lengths = np.array([len(c) for c in counts], dtype=np.int64)
+    rle_idxs = np.repeat(np.arange(len(rles)), lengths)
+    if len(counts) == 0:
+        return np.zeros(0, dtype=np.int32), rle_idxs
+    return np.concatenate(counts), rle_idxs
+
+
+def _run_parity(rle_idxs: np.ndarray) -> np.ndarray:
+    # Runs alternate between background and foreground, starting from
+    # background at the first count of every RLE
+    starts = np.flatnonzero(np.diff(rle_idxs, prepend=-1))
+    position = np.arange(len(rle_idxs)) - np.repeat(
+        starts, np.diff(starts, append=len(rle_idxs))
+    )
+    return (position % 2).astype(bool)
+
+
+def batched_rle_to_mask(rles: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Decodes uncompressed RLEs of the same size into an NxHxW boolean
+    array with one np.repeat over all of their runs.
+    """
+    if len(rles) == 0:
+        return np.zeros((0, 0, 0), dtype=bool)
+    h, w = rles[0]["size"]
+    assert all(
+        list(rle["size"]) == [h, w] for rle in rles
+    ), "Batched RLEs must all have the same size."
+    counts, rle_idxs = _concat_counts(rles)
+    masks = np.repeat(_run_parity(rle_idxs), counts)
+    return masks.reshape(len(rles), w, h).transpose(0, 2, 1)  # Put in C order
+
+
+def batched_area_from_rle(rles: List[Dict[str, Any]]) -> np.ndarray:
+    """Returns the foreground area of each RLE as an int64 array."""
+    # Foreground runs of all RLEs summed per RLE in one pass
+    counts, rle_idxs = _concat_counts(rles)
+    foreground = counts * _run_parity(rle_idxs)
+    areas = np.bincount(rle_idxs, weights=foreground, minlength=len(rles))
+    return areas.astype(np.int64)
+
+
+def batched_rle_to_box(rles: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Calculates boxes in XYXY format around the masks of uncompressed RLEs
+    without decoding them, matching batched_mask_to_box. Returns [0,0,0,0]
+    for an empty mask.
+    """
+    boxes = np.zeros((len(rles), 4), dtype=np.int64)
+    if len(rles) == 0:
+        return boxes
+    counts, rle_idxs = _concat_counts(rles)
+    ends = np.cumsum(counts.astype(np.int64))
+    # Positions restart at zero for every RLE
+    starts_of_rles = np.flatnonzero(np.diff(rle_idxs, prepend=-1))
+    offsets = np.repeat(
+        np.concatenate([[0], ends[starts_of_rles[1:] - 1]]),
+        np.diff(starts_of_rles, append=len(rle_idxs)),
+    )
+    ends -= offsets
+    keep = _run_parity(rle_idxs) & (counts > 0)
+    rle_idxs, counts, ends = rle_idxs[keep], counts[keep], ends[keep]
+    if len(rle_idxs) == 0:
+        return boxes
+
+    # Runs follow columns, so a run crossing a column covers the full height
+    h = np.array([rle["size"][0] for rle in rles])[rle_idxs]
+    first, last = ends - counts, ends - 1
+    x0, x1 = first // h, last // h
+    y0 = np.where(x1 > x0, 0, first % h)
+    y1 = np.where(x1 > x0, h - 1, last % h)
+
+    num = len(rles)
+    big = np.iinfo(np.int64).max
+    boxes[:, 0], boxes[:, 1] = big, big
+    has_area = np.zeros(num, dtype=bool)
+    has_area[rle_idxs] = True
+    np.minimum.at(boxes[:, 0], rle_idxs, x0)
+    np.minimum.at(boxes[:, 1], rle_idxs, y0)
+    np.maximum.at(boxes[:, 2], rle_idxs, x1)
+    np.maximum.at(boxes[:, 3], rle_idxs, y1)
+    boxes[~has_area] = 0
+    return boxes
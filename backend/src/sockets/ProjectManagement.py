@@ -3,6 +3,7 @@ import numpy as np
 import base64
 import json
 from flask_socketio import Namespace, emit
+from ..utils.maskPayload import encode_mask, mask_formats
 from ..utils.response import Response
 from ..logger import logger
 from src.utils.utils import findVerticesFromMasks
@@ -14,6 +15,7 @@ class ProjectManagement(Namespace):
         emit("connected", respose.__dict__, to=request.sid)
 
     def on_disconnect(self):
+        app.predictor.remove_session(request.sid)
         response = Response(data=None, status=200, message="disconnected")
         emit("disconnected", response.__dict__, to=request.sid)
 
@@ -81,6 +83,7 @@ class ProjectManagement(Namespace):
         project_id = data["project_id"]
         image_id = data["image_id"]
         app.database.delete_image(project_id, image_id)
+        app.predictor.forget_image(image_id)
         project = app.database.get_project(project_id)
         response = Response(
             data=project.dict(), status=200, message="Image deleted successfully"
@@ -141,33 +144,115 @@ class ProjectManagement(Namespace):
         logger.debug("Setting magic image")
         project_id = data["project_id"]
         image_id = data["image_id"]
-        image = app.database.get_image(image_id)
-        if image is None:
+        try:
+            metadata = app.database.get_image_metadata(image_id)
+        except KeyError:
             response = Response(data=None, status=404, message="Image not found")
             emit("set_magic_image", response.__dict__, to=request.sid)
             return
 
-        image_embeddings = app.predictor.set_image(
-            image.image_ndarray, image.image_embeddings
+        app.precomputer.on_image_opened(project_id, image_id)
+        sid = request.sid
+        database = app.database
+        img_size = app.predictor.sam.image_encoder.img_size
+        image_size = (metadata.height, metadata.width)
+        # Very large images are encoded tile by tile as prompts reach them
+        tiled = app.predictor.use_tiles(image_size)
+        # Cached embeddings skip the Redis round trip and deserialisation
+        cached = tiled or app.predictor.is_image_cached(image_id)
+        stored_embeddings = None if cached else database.get_image_embeddings(image_id)
+        if tiled:
+            pending_image = app.predictor.set_tiled_image(
+                sid, image_id, lambda: database.get_image(image_id).image_ndarray
+            )
+        else:
+            pending_image = app.predictor.set_image(
+                sid,
+                image_id,
+                lambda: database.get_image(image_id).reduced_ndarray(img_size),
+                stored_embeddings,
+                image_size=image_size,
+            )
+
+        def on_image_encoded(future):
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.exception(f"Failed to encode image {image_id}")
+                response = Response(data=None, status=500, message=str(e))
+                self.emit("magic_image_ready", response.__dict__, to=sid)
+                return
+            if not cached and stored_embeddings is None:
+                database.set_image_embeddings(image_id, result[0])
+            response = Response(
+                data={"image_id": image_id},
+                status=200,
+                message="Image set successfully",
+            )
+            self.emit("magic_image_ready", response.__dict__, to=sid)
+
+        response = Response(
+            data={"image_id": image_id}, status=202, message="Image queued for encoding"
         )
-        if image.image_embeddings is None:
-            app.database.set_image_embeddings(image_id, image_embeddings)
-        response = Response(data=None, status=200, message="Image set successfully")
         emit("set_magic_image", response.__dict__, to=request.sid)
+        pending_image.add_done_callback(on_image_encoded)
+
+    def check_mask_format(self, mask_format, event):
+        if mask_format is None or mask_format in mask_formats:
+            return True
+        response = Response(
+            data=None, status=400, message=f"Unknown mask format {mask_format}"
+        )
+        emit(event, response.__dict__, to=request.sid)
+        return False
+
+    def emit_no_prediction(self, event):
+        # No image set, encoding failed or the image was replaced while waiting
+        response = Response(
+            data=None, status=400, message="No image set for prediction"
+        )
+        emit(event, response.__dict__, to=request.sid)
+
+    def predict_mask(self, session, mask_format):
+        # Without a format the full boolean masks are sent, as before, except
+        # for tiled images, too large for a full mask on every click
+        if mask_format is None and session.is_tiled:
+            mask_format = "packbits"
+        if mask_format is None:
+            return session.predict()
+        result = session.predict_crop()
+        if result is None:
+            return None
+        masks, offset = result
+        return encode_mask(masks, offset, session.original_size, mask_format)
 
     def on_add_magic_point(self, data):
         point = data["point"]
         label = data["label"]
-        app.predictor.add_point(np.array(point), label)
-        mask = app.predictor.predict()
+        session = app.predictor.get_session(request.sid)
+        mask_format = data.get("format")
+        if not self.check_mask_format(mask_format, "add_magic_point"):
+            return
+        session.add_point(np.array(point), label)
+        mask = self.predict_mask(session, mask_format)
+        if mask is None:
+            self.emit_no_prediction("add_magic_point")
+            return
         logger.info("Finish predict mask")
         response = Response(data=mask, status=200, message="Point added successfully")
         emit("add_magic_point", response.__dict__, to=request.sid)
 
     def on_add_magic_box(self, data):
         box = data["box"]
-        app.predictor.set_input_box(np.array(box))
-        mask = app.predictor.predict()
+        session = app.predictor.get_session(request.sid)
+        mask_format = data.get("format")
+        if not self.check_mask_format(mask_format, "add_magic_box"):
+            return
+        session.set_input_box(np.array(box))
+        mask = self.predict_mask(session, mask_format)
+        if mask is None:
+            self.emit_no_prediction("add_magic_box")
+            return
         logger.info("Finish predict mask")
         response = Response(data=mask, status=200, message="Box added successfully")
         emit("add_magic_box", response.__dict__, to=request.sid)
@@ -179,11 +264,23 @@ class ProjectManagement(Namespace):
             response = Response(data=None, status=400, message="No points set")
             emit("set_magic_points", response.__dict__, to=request.sid)
             return
-        app.predictor.set_points(np.array(points), np.array(labels))
-        masks = app.predictor.predict()
-        vertices = findVerticesFromMasks(masks)
+        mask_format = data.get("format")
+        if not self.check_mask_format(mask_format, "set_magic_points"):
+            return
+        session = app.predictor.get_session(request.sid)
+        session.set_points(np.array(points), np.array(labels))
+        mask = None
+        if mask_format is None:
+            result = session.predict_crop()
+            if result is not None:
+                mask = json.dumps(findVerticesFromMasks(*result))
+        else:
+            mask = self.predict_mask(session, mask_format)
+        if mask is None:
+            self.emit_no_prediction("set_magic_points")
+            return
         response = Response(
-            data=json.dumps(vertices),
+            data=mask,
             status=200,
             message="Points set successfully",
         )
@@ -0,0 +1,43 @@
+from typing import Optional, Tuple
+from ..config import defaultImageConfig
+from .lruCache import LRUCache
+import io
+import math
+import numpy as np
+import PIL.Image
+
+# Decoded pixels and the (height, width) of the full size image
+DecodedImage = Tuple[np.ndarray, Tuple[int, int]]
+
+decoded_images = LRUCache(
+    defaultImageConfig.decoded_cache_bytes, lambda decoded: decoded[0].nbytes
+)
+
+
+def decode_image(image_bytes: bytes, min_size: Optional[int] = None) -> DecodedImage:
+    image = PIL.Image.open(io.BytesIO(image_bytes))
+    original_size = (image.height, image.width)
+    if min_size is not None and defaultImageConfig.reduced_decoding:
+        # JPEGs decode straight to 1/2, 1/4 or 1/8 scale, never below this size
+        scale = min_size / max(image.size)
+        if scale < 1:
+            draft_size = (
+                math.ceil(image.width * scale),
+                math.ceil(image.height * scale),
+            )
+            image.draft(image.mode, draft_size)
+    pixels = np.ascontiguousarray(np.array(image, dtype=np.uint8)[:, :, :3])
+    return pixels, original_size
+
+
+def load_image(
+    image_id: str, image_bytes: bytes, min_size: Optional[int] = None
+) -> DecodedImage:
+    # Cached arrays are shared between callers, so they are made read-only
+    key = (image_id, min_size)
+    decoded = decoded_images.get(key)
+    if decoded is None:
+        decoded = decode_image(image_bytes, min_size)
+        decoded[0].setflags(write=False)
+        decoded_images.put(key, decoded)
+    return decoded
@@ -0,0 +1,46 @@
+from typing import Tuple
+from .polygons import masks_to_polygons
+import numpy as np
+
+mask_formats = ["polygon", "rle", "packbits"]
+
+
+def mask_to_rle(
+    mask: np.ndarray, offset: Tuple[int, int], image_size: Tuple[int, int]
+) -> dict:
+    # Uncompressed COCO RLE of the whole image, built from a crop at offset
+    top, left = offset
+    h, w = image_size
+    padded = np.pad(mask.astype(bool), ((1, 1), (0, 0)))
+    columns = padded.T.reshape(-1)
+    changes = np.flatnonzero(columns[1:] != columns[:-1])
+    # Padding rows keep runs from crossing columns, so a change after padded
+    # row r of crop column x sits at row top + r of image column left + x
+    rows = changes % padded.shape[0]
+    cols = changes // padded.shape[0]
+    positions = (left + cols) * h + top + rows
+    boundaries = np.concatenate([[0], positions, [h * w]])
+    return {"size": [h, w], "counts": np.diff(boundaries).tolist()}
+
+
+def encode_mask(
+    masks: np.ndarray,
+    offset: Tuple[int, int],
+    image_size: Tuple[int, int],
+    mask_format: str,
+) -> dict:
+    assert mask_format in mask_formats, f"Unknown mask format {mask_format}."
+    mask = masks[0]
+    payload = {"format": mask_format, "size": list(image_size)}
+    if mask_format == "polygon":
+        # Each polygon is its exterior ring followed by its holes
+        polygons = masks_to_polygons(masks[:1], offset)[0]
+        payload["polygons"] = [[ring.tolist() for ring in rings] for rings in polygons]
+    elif mask_format == "rle":
+        payload["rle"] = mask_to_rle(mask, offset, image_size)
+    else:
+        # Bytes go out as a binary Socket.IO attachment
+        payload["offset"] = list(offset)
+        payload["shape"] = list(mask.shape)
+        payload["bits"] = np.packbits(mask, axis=None).tobytes()
+    return payload
@@ -0,0 +1,106 @@
+from typing import List, Optional, Tuple
+import cv2
+import numpy as np
+
+# A polygon is its exterior ring followed by its holes, each an (N, 2) array of
+# x, y vertices in image coordinates
+Polygon = List[np.ndarray]
+
+
+def mask_bounds(masks: np.ndarray) -> np.ndarray:
+    # (top, bottom, left, right) per mask, empty masks get an empty range
+    rows = masks.any(axis=2)
+    cols = masks.any(axis=1)
+    height, width = masks.shape[1:]
+    top = rows.argmax(axis=1)
+    bottom = height - rows[:, ::-1].argmax(axis=1)
+    left = cols.argmax(axis=1)
+    right = width - cols[:, ::-1].argmax(axis=1)
+    bounds = np.stack([top, bottom, left, right], axis=1)
+    bounds[~rows.any(axis=1)] = 0
+    return bounds
+
+
+def simplify_ring(
+    contour: np.ndarray, tolerance: float, relative_tolerance: Optional[float]
+) -> np.ndarray:
+    epsilon = tolerance
+    if relative_tolerance is not None:
+        epsilon = relative_tolerance * cv2.arcLength(contour, True)
+    if epsilon > 0:
+        contour = cv2.approxPolyDP(contour, epsilon, True)
+    return contour.reshape(-1, 2)
+
+
+def mask_to_polygons(
+    mask: np.ndarray,
+    offset: Tuple[int, int] = (0, 0),
+    tolerance: float = 1.0,
+    relative_tolerance: Optional[float] = None,
+    min_area: float = 0.0,
+    holes: bool = True,
+) -> List[Polygon]:
+    # A one pixel border keeps contours clear of the crop edges
+    mask = np.pad(mask.astype(np.uint8), 1)
+    mode = cv2.RETR_CCOMP if holes else cv2.RETR_EXTERNAL
+    contours, hierarchy = cv2.findContours(mask, mode, cv2.CHAIN_APPROX_SIMPLE)
+    if len(contours) == 0:
+        return []
+    shift = np.array([offset[1] - 1, offset[0] - 1], dtype=np.int32)
+
+    # With RETR_CCOMP, top level contours are exteriors and their children holes
+    polygons = []
+    hierarchy = hierarchy[0]
+    for i, contour in enumerate(contours):
+        if hierarchy[i, 3] != -1:
+            continue
+        area = cv2.contourArea(contour)
+        children = []
+        child = hierarchy[i, 2]
+        while child != -1:
+            hole_area = cv2.contourArea(contours[child])
+            if hole_area >= min_area:
+                children.append(contours[child])
+                area -= hole_area
+            child = hierarchy[child, 0]
+        if area < min_area:
+            continue
+        polygons.append(
+            [
+                simplify_ring(ring, tolerance, relative_tolerance) + shift
+                for ring in [contour, *children]
+            ]
+        )
+    return polygons
+
+
+def masks_to_polygons(
+    masks: np.ndarray,
+    offset: Tuple[int, int] = (0, 0),
+    tolerance: float = 1.0,
+    relative_tolerance: Optional[float] = None,
+    min_area: float = 0.0,
+    holes: bool = True,
+) -> List[List[Polygon]]:
+    # Traces each mask of a BxHxW batch only within its own bounding box
+    if masks.ndim == 2:
+        masks = masks[None]
+    if masks.shape[1] == 0 or masks.shape[2] == 0:
+        # An empty crop, as returned for predictions with no foreground
+        return [[] for _ in masks]
+    polygons = []
+    for mask, (top, bottom, left, right) in zip(masks, mask_bounds(masks)):
+        if bottom <= top:
+            polygons.append([])
+            continue
+        polygons.append(
+            mask_to_polygons(
+                mask[top:bottom, left:right],
+                (offset[0] + top, offset[1] + left),
+                tolerance,
+                relative_tolerance,
+                min_area,
+                holes,
+            )
+        )
+    return polygons
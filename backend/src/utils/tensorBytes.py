@@ -0,0 +1,95 @@
+from typing import Tuple, Union
+import numpy as np
+import struct
+import sys
+import torch
+
+# Header: magic, dtype code, number of dims, then one uint32 per dim
+MAGIC = b"FTEN"
+HEADER_FORMAT = "<4sBB"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+DTYPE_CODES = {"float32": 0, "float16": 1, "int8": 2}
+TORCH_DTYPES = {"float32": torch.float32, "float16": torch.float16, "int8": torch.int8}
+NUMPY_DTYPES = {"float32": "<f4", "float16": "<f2", "int8": "i1"}
+
+
+def channel_axis(ndim: int) -> int:
+    # Channels of [B,]C,H,W tensors, the first axis otherwise
+    return max(ndim - 3, 0)
+
+
+def quantize_per_channel(array: np.ndarray) -> Tuple[np.ndarray, ...]:
+    axis = channel_axis(array.ndim)
+    reduce_axes = tuple(i for i in range(array.ndim) if i != axis)
+    view_shape = [1] * array.ndim
+    view_shape[axis] = array.shape[axis]
+
+    # Include zero in the range so it is represented exactly
+    low = np.minimum(array.min(axis=reduce_axes), 0).astype(np.float32)
+    high = np.maximum(array.max(axis=reduce_axes), 0).astype(np.float32)
+    scales = np.maximum((high - low) / 255.0, np.finfo(np.float32).tiny)
+    zero_points = np.clip(np.round(-128.0 - low / scales), -128, 127)
+
+    quantized = np.round(array / scales.reshape(view_shape))
+    quantized += zero_points.reshape(view_shape)
+    quantized = np.clip(quantized, -128, 127).astype(np.int8)
+    return quantized, scales.astype("<f4"), zero_points.astype(np.int8)
+
+
+def tensor_to_bytes(tensor: torch.Tensor, dtype: str = "float16") -> bytes:
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported tensor storage dtype {dtype}")
+    array = tensor.detach().cpu().numpy()
+    header = struct.pack(HEADER_FORMAT, MAGIC, DTYPE_CODES[dtype], array.ndim)
+    shape = struct.pack(f"<{array.ndim}I", *array.shape)
+    if dtype == "int8":
+        # Per-channel scales and zero points precede the quantized values
+        quantized, scales, zero_points = quantize_per_channel(array)
+        return (
+            header
+            + shape
+            + scales.tobytes()
+            + zero_points.tobytes()
+            + np.ascontiguousarray(quantized).tobytes()
+        )
+    array = array.astype(NUMPY_DTYPES[dtype], copy=False)
+    return header + shape + np.ascontiguousarray(array).tobytes()
+
+
+def tensor_from_bytes(
+    data: Union[bytes, bytearray], dtype: torch.dtype = torch.float32
+) -> torch.Tensor:
+    magic, dtype_code, ndim = struct.unpack_from(HEADER_FORMAT, data)
+    if magic != MAGIC:
+        raise ValueError("Data is not a serialised tensor")
+    stored_dtype = {code: name for name, code in DTYPE_CODES.items()}[dtype_code]
+    shape = struct.unpack_from(f"<{ndim}I", data, HEADER_SIZE)
+    offset = HEADER_SIZE + 4 * ndim
+
+    scales = zero_points = None
+    if stored_dtype == "int8":
+        channels = shape[channel_axis(ndim)]
+        scales = np.frombuffer(data, dtype="<f4", count=channels, offset=offset)
+        offset += 4 * channels
+        zero_points = np.frombuffer(data, dtype="i1", count=channels, offset=offset)
+        offset += channels
+
+    if sys.byteorder == "little":
+        # torch.frombuffer needs a writable buffer to avoid aliasing warnings
+        buffer = data if isinstance(data, bytearray) else bytearray(data)
+        tensor = torch.frombuffer(
+            buffer, dtype=TORCH_DTYPES[stored_dtype], offset=offset
+        )
+    else:
+        array = np.frombuffer(data, dtype=NUMPY_DTYPES[stored_dtype], offset=offset)
+        tensor = torch.from_numpy(array.astype(array.dtype.newbyteorder("=")))
+    tensor = tensor.reshape(shape)
+
+    if scales is not None:
+        view_shape = [1] * ndim
+        view_shape[channel_axis(ndim)] = -1
+        scales = torch.from_numpy(scales.astype(np.float32)).reshape(view_shape)
+        zero_points = torch.from_numpy(zero_points.astype(np.float32))
+        tensor = (tensor.float() - zero_points.reshape(view_shape)) * scales
+    return tensor.to(dtype)
@@ -1,7 +1,8 @@
-import cv2
 import numpy as np
 from ..Database.models import Project
 from datetime import datetime, timezone
+from typing import Tuple
+from .polygons import masks_to_polygons
 import hashlib
 
 
@@ -9,21 +10,14 @@ def hashString(string: str) -> str:
     return hashlib.sha256(string.encode()).hexdigest()
 
 
-def findVerticesFromMasks(masks: np.ndarray):
-    masks = masks[0, :, :]
-    masks = 255 * np.uint8(masks)
-    contours, hierarchy = cv2.findContours(
-        masks, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-    )
-
-    # Approximate contours to polygons and get vertices
-    vertices = []
-    for contour in contours:
-        epsilon = 0.01 * cv2.arcLength(contour, True)  # Adjust epsilon for your needs
-        approx = cv2.approxPolyDP(contour, epsilon, True)
-        approx = approx.reshape(-1, 2).tolist()
-        vertices.append(approx)
-    return vertices
+def findVerticesFromMasks(masks: np.ndarray, offset: Tuple[int, int] = (0, 0)):
+    # Masks may be a crop of the image starting at offset, in (top, left) order
+    if masks[:1].size == 0:
+        return []
+    polygons = masks_to_polygons(
+        masks[:1], offset, relative_tolerance=0.01, holes=False
+    )[0]
+    return [polygon[0].tolist() for polygon in polygons]
 
 
 def exportProjectToCOCO(project: Project) -> dict:
@@ -0,0 +1,23 @@
+from segment_anything.build_sam import build_sam_vit_b
+from segment_anything.modeling import Sam
+import numpy as np
+import pytest
+import torch
+
+
+@pytest.fixture(scope="session")
+def sam() -> Sam:
+    # Random weights, so no checkpoint is needed to compare backends
+    torch.manual_seed(0)
+    return build_sam_vit_b()
+
+
+@pytest.fixture(scope="session")
+def image() -> np.ndarray:
+    # Smooth gradients with a bright disk, closer to a photo than noise
+    h, w = 480, 640
+    y, x = np.mgrid[:h, :w]
+    disk = ((x - 400) ** 2 + (y - 200) ** 2 < 90**2) * 120
+    image = np.stack([x * 255 / w, y * 255 / h, (x + y) * 127 / (h + w)], axis=-1)
+    image[..., 0] += disk
+    return np.clip(image, 0, 255).astype(np.uint8)
@@ -0,0 +1,76 @@
+from segment_anything import SamPredictor
+from segment_anything.modeling import Sam
+from src.decoders import OnnxMaskDecoder, TorchMaskDecoder, export_onnx_decoder
+from src.scheduler import DecodeRequest
+import numpy as np
+import pytest
+import torch
+
+pytest.importorskip("onnxruntime")
+
+ORIGINAL_SIZE = (600, 900)
+MASK_INPUT = np.random.default_rng(0).normal(size=(1, 256, 256)).astype(np.float32)
+
+PROMPTS = {
+    "points": dict(
+        point_coords=np.array([[450.0, 300.0], [200.0, 120.0]]),
+        point_labels=np.array([1, 0]),
+    ),
+    "point_and_box": dict(
+        point_coords=np.array([[450.0, 300.0]]),
+        point_labels=np.array([1]),
+        box=np.array([300.0, 150.0, 700.0, 500.0]),
+    ),
+    "mask_input": dict(
+        point_coords=np.array([[450.0, 300.0], [520.0, 340.0]]),
+        point_labels=np.array([1, 1]),
+        mask_input=MASK_INPUT,
+    ),
+}
+
+
+@pytest.fixture(scope="module")
+def predictor(sam: Sam) -> SamPredictor:
+    predictor = SamPredictor(sam)
+    input_size = predictor.transform.get_preprocess_shape(
+        *ORIGINAL_SIZE, sam.image_encoder.img_size
+    )
+    features = torch.randn(1, 256, 64, 64, generator=torch.Generator().manual_seed(0))
+    predictor.set_image_embedding(features, ORIGINAL_SIZE, input_size)
+    return predictor
+
+
+@pytest.fixture(scope="module")
+def onnx_decoder(sam: Sam) -> OnnxMaskDecoder:
+    return OnnxMaskDecoder(sam, model_path=export_onnx_decoder(sam))
+
+
+def decode(decoder, predictor: SamPredictor, prompt: dict, multimask_output: bool):
+    request = DecodeRequest(
+        predictor.features,
+        predictor.input_size,
+        predictor.original_size,
+        *predictor.prepare_prompts(**prompt),
+        multimask_output=multimask_output,
+    )
+    decoder.decode([request])
+    return [output.numpy() for output in request.future.result()]
+
+
+@pytest.mark.parametrize("multimask_output", [False, True])
+@pytest.mark.parametrize("prompt", list(PROMPTS))
+def test_onnx_decoder_matches_torch(
+    sam, predictor, onnx_decoder, prompt, multimask_output
+):
+    masks, scores, logits = decode(
+        TorchMaskDecoder(sam), predictor, PROMPTS[prompt], multimask_output
+    )
+    onnx_masks, onnx_scores, onnx_logits = decode(
+        onnx_decoder, predictor, PROMPTS[prompt], multimask_output
+    )
+
+    assert onnx_masks.shape == masks.shape
+    np.testing.assert_allclose(onnx_scores, scores, rtol=1e-3, atol=1e-4)
+    np.testing.assert_allclose(onnx_logits, logits, rtol=1e-3, atol=1e-3)
+    # Only pixels whose logit sits at the threshold may flip
+    assert (onnx_masks != masks).mean() < 1e-3
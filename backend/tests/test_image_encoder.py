@@ -0,0 +1,31 @@
+from segment_anything.modeling.image_encoder import Attention
+import pytest
+import torch
+
+
+@pytest.mark.parametrize(
+    "input_size, num_heads",
+    # A windowed block and a global block of vit_b, with few heads to keep
+    # the reference attention map small
+    [((14, 14), 4), ((64, 64), 1)],
+)
+def test_sdpa_attention_matches_reference(input_size, num_heads):
+    torch.manual_seed(0)
+    attention = Attention(
+        dim=64,
+        num_heads=num_heads,
+        use_rel_pos=True,
+        rel_pos_zero_init=False,
+        input_size=input_size,
+    ).eval()
+    torch.nn.init.normal_(attention.rel_pos_h, std=0.5)
+    torch.nn.init.normal_(attention.rel_pos_w, std=0.5)
+    x = torch.randn(2, *input_size, 64)
+
+    with torch.no_grad():
+        attention.use_sdpa = False
+        reference = attention(x)
+        attention.use_sdpa = True
+        fused = attention(x)
+
+    torch.testing.assert_close(fused, reference, rtol=1e-4, atol=1e-5)
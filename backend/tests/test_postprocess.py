@@ -0,0 +1,37 @@
+from segment_anything.utils.transforms import ResizeLongestSide
+import pytest
+import torch
+
+CASES = {
+    # name: (original_size, foreground rows and columns in the 256x256 logits)
+    "empty": ((3000, 4000), None),
+    "small_object": ((3000, 4000), (slice(100, 112), slice(60, 75))),
+    "touching_edges": ((1500, 2250), (slice(0, 20), slice(230, 256))),
+    "downscaled": ((600, 800), (slice(90, 140), slice(30, 60))),
+    "large_object": ((1500, 2250), (slice(10, 160), slice(5, 250))),
+}
+
+
+@pytest.mark.parametrize("case", list(CASES))
+@torch.no_grad()
+def test_postprocess_masks_roi_matches_dense(sam, case):
+    original_size, foreground = CASES[case]
+    input_size = ResizeLongestSide.get_preprocess_shape(
+        *original_size, sam.image_encoder.img_size
+    )
+    # Asymmetric logits keep interpolated pixels off the threshold
+    masks = torch.full((1, 2, 256, 256), -8.0)
+    masks += 0.5 * torch.rand(masks.shape, generator=torch.Generator().manual_seed(0))
+    if foreground is not None:
+        masks[0, 0, foreground[0], foreground[1]] = 5.0
+
+    dense = sam.postprocess_masks(masks, input_size, original_size) > 0
+    crop, (top, left) = sam.postprocess_masks_roi(masks, input_size, original_size)
+    bottom, right = top + crop.shape[-2], left + crop.shape[-1]
+
+    assert torch.equal(crop > 0, dense[..., top:bottom, left:right])
+    # Nothing outside the crop is foreground
+    dense[..., top:bottom, left:right] = False
+    assert not dense.any()
+    if foreground is None:
+        assert crop.numel() == 0
@@ -0,0 +1,22 @@
+from src.decoder_check import check_decoder_parity
+from src.decoders import TorchMaskDecoder
+from src.embedding_check import check_image_encoder
+from src.encoders import AutocastImageEncoder
+
+# Masks of a reduced precision pass against float32, over random prompts
+MIN_MEAN_IOU = 0.9
+MIN_IOU = 0.75
+
+
+def test_bfloat16_encoder_masks_match_float32(sam, image):
+    encoder = AutocastImageEncoder(sam.image_encoder, "bfloat16")
+    report = check_image_encoder(sam, [image], encoder, num_points=8)
+    assert report["mean_iou"] >= MIN_MEAN_IOU, report
+    assert report["min_iou"] >= MIN_IOU, report
+
+
+def test_bfloat16_decoder_masks_match_float32(sam, image):
+    decoder = TorchMaskDecoder(sam, "bfloat16")
+    report = check_decoder_parity(sam, [image], decoder, num_prompts=8)
+    assert report["mean_iou"] >= MIN_MEAN_IOU, report
+    assert report["min_iou"] >= MIN_IOU, report
@@ -0,0 +1,65 @@
+from segment_anything.modeling import PromptEncoder
+from src.predictor import PredictorSession
+import pytest
+import torch
+
+PROMPTS = {
+    "points": (True, False),
+    "points_and_box": (True, True),
+    "box": (False, True),
+}
+
+
+@pytest.fixture(scope="module")
+def prompt_encoder() -> PromptEncoder:
+    torch.manual_seed(0)
+    return PromptEncoder(
+        embed_dim=256,
+        image_embedding_size=(64, 64),
+        input_image_size=(1024, 1024),
+        mask_in_chans=16,
+    ).eval()
+
+
+def random_prompts(num_points: int = 3):
+    coords = torch.rand(1, num_points, 2) * 1024
+    labels = torch.randint(0, 2, (1, num_points))
+    box = torch.tensor([[100.0, 200.0, 600.0, 700.0]])
+    mask = torch.randn(1, 1, 256, 256)
+    return coords, labels, box, mask
+
+
+@pytest.mark.parametrize("with_mask", [False, True])
+@pytest.mark.parametrize("prompt", list(PROMPTS))
+@torch.no_grad()
+def test_combine_embeddings_matches_forward(prompt_encoder, prompt, with_mask):
+    with_points, with_box = PROMPTS[prompt]
+    coords, labels, box, mask = random_prompts()
+    points = (coords, labels) if with_points else None
+    box = box if with_box else None
+    mask = mask if with_mask else None
+
+    sparse, dense = prompt_encoder(points=points, boxes=box, masks=mask)
+    combined_sparse, combined_dense = prompt_encoder.combine_embeddings(
+        None if points is None else prompt_encoder.embed_points(*points),
+        None if box is None else prompt_encoder.embed_boxes(box),
+        None if mask is None else prompt_encoder.embed_masks(mask),
+    )
+    torch.testing.assert_close(combined_sparse, sparse)
+    torch.testing.assert_close(combined_dense, dense)
+
+
+@pytest.mark.parametrize("with_box", [False, True])
+def test_incremental_clicks_match_single_pass(sam, with_box):
+    torch.manual_seed(0)
+    coords, labels, box, _ = random_prompts(num_points=5)
+    box = box if with_box else None
+    session = PredictorSession(sam, scheduler=None)
+    for n in range(1, coords.shape[1] + 1):
+        sparse, _ = session.get_prompt_embeddings(
+            coords[:, :n], labels[:, :n], box, None
+        )
+
+    with torch.no_grad():
+        expected, _ = sam.prompt_encoder(points=(coords, labels), boxes=box, masks=None)
+    torch.testing.assert_close(sparse, expected)
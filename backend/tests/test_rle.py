@@ -0,0 +1,44 @@
+from segment_anything.utils.amg import batched_mask_to_box, batched_mask_to_rle
+from segment_anything.utils.rle import (
+    batched_area_from_rle,
+    batched_rle_to_box,
+    batched_rle_to_mask,
+)
+import numpy as np
+import pytest
+import torch
+
+
+@pytest.fixture(scope="module")
+def masks() -> torch.Tensor:
+    # Empty, full, single pixel, column-crossing and random masks
+    generator = torch.Generator().manual_seed(0)
+    masks = torch.zeros(8, 12, 9, dtype=torch.bool)
+    masks[1] = True
+    masks[2, 11, 8] = True
+    masks[3, 9:, 2] = True
+    masks[3, :3, 3] = True
+    masks[4, 0, 0] = True
+    masks[5:] = torch.rand((3, 12, 9), generator=generator) > 0.7
+    return masks
+
+
+def test_batched_rle_to_mask_round_trip(masks):
+    rles = batched_mask_to_rle(masks)
+    np.testing.assert_array_equal(batched_rle_to_mask(rles), masks.numpy())
+
+
+def test_batched_area_from_rle(masks):
+    areas = batched_area_from_rle(batched_mask_to_rle(masks))
+    assert areas.dtype == np.int64
+    np.testing.assert_array_equal(areas, masks.sum(dim=(1, 2)).numpy())
+
+
+def test_batched_rle_to_box_matches_mask_boxes(masks):
+    boxes = batched_rle_to_box(batched_mask_to_rle(masks))
+    np.testing.assert_array_equal(boxes, batched_mask_to_box(masks).numpy())
+
+
+def test_empty_batches():
+    assert batched_area_from_rle([]).shape == (0,)
+    assert batched_rle_to_box([]).shape == (0, 4)